@@ -1,7 +1,24 @@
-from flask import Flask, jsonify, request
+from collections import OrderedDict
+from flask import Flask, Response, jsonify, request
 from flasgger import Swagger
+import gzip
+import hashlib
 import importlib
+import os
+import threading
+import time
 import traceback
+from prazo import Prazo
+from registros import serializar
+import cache_detalhes
+import exportar
+import fila
+import versoes
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # ========== CONFIGURAÇÃO BASE ==========
 app = Flask(__name__)
@@ -14,6 +31,15 @@ swagger_template = {
         Cada scraper tem um **ID fixo** e permite:
         - Consultar o número total de páginas disponíveis (`/scripts`)
         - Extrair transportadoras de uma página específica (`/executar?id=...&pagina=...`)
+        - Extrair o catálogo completo descoberto via sitemap (`/catalogo?id=...&pagina=...`)
+        - Distribuir uma faixa de páginas entre várias réplicas (`/rodadas`)
+        - Exportar as transportadoras acumuladas em CSV, NDJSON ou Parquet (`/export`)
+
+        Respostas JSON saem comprimidas (gzip ou brotli, via `Accept-Encoding`) e com `ETag` forte
+        calculado do conteúdo; repita a consulta com `If-None-Match` para receber `304` se nada mudou.
+        Em `/scripts`, `/executar` e `/catalogo`, um ETag visto há menos de `CACHE_ETAGS_TTL` segundos
+        (padrão 300) recebe `304` direto, sem nova raspagem; depois disso a consulta raspa de novo e o
+        `304` só sai se o conteúdo não mudou.
         """,
         "version": "1.0.0",
         "contact": {
@@ -26,6 +52,16 @@ swagger_template = {
 
 swagger = Swagger(app, template=swagger_template)
 
+# ========== MOTOR DE SCRAPING ==========
+# "sync" = requests + threads de cada módulo | "async" = motor_async (aiohttp)
+MOTOR = os.environ.get("MOTOR_SCRAPER", "sync")
+
+# ========== LIMITE DE TAXA POR HOST ==========
+# Opcional (INTERVALO_HOST_MS, padrão 0): quando ligado vale para toda busca deste processo
+# (/executar, /catalogo e trabalhadores da fila), em qualquer motor, e limita a vazão por host
+fila.ativar_limitador()
+_versionar_rodada_lock = threading.Lock()
+
 # ========== MAPA DE SCRIPTS ==========
 SCRIPTS = {
     1: {"nome": "Portal dos Fretes", "modulo": "app"},
@@ -34,6 +70,134 @@ SCRIPTS = {
 }
 
 
+# ========== CONTADORES DO CACHE DE DETALHES ==========
+def com_contadores(resposta, contadores):
+    resposta.headers["X-Detalhes-Analisados"] = str(contadores.analisadas)
+    resposta.headers["X-Detalhes-Reaproveitados"] = str(contadores.reaproveitadas)
+    return resposta
+
+
+# ========== PRAZO DA REQUISIÇÃO ==========
+def ler_deadline_ms(valor):
+    # Valor inválido não pode virar "sem prazo", nem zero/negativo um parcial vazio instantâneo
+    deadline_ms = int(valor)
+    if deadline_ms <= 0:
+        raise ValueError(valor)
+    return deadline_ms
+
+
+# ========== VERSIONAMENTO / DELTA ==========
+def versionar(escopo, resultado, since=None, coleta_id=None):
+    if isinstance(resultado, list):
+        transportadoras, parcial = resultado, False
+    elif "transportadoras" in resultado:
+        transportadoras, parcial = resultado["transportadoras"], resultado.get("parcial", False)
+    else:
+        return resultado, None  # ex.: {"mensagem": ...}
+
+    if coleta_id is None:
+        coleta_id = versoes.registrar(escopo, transportadoras, parcial)
+    if since is None:
+        return resultado, coleta_id
+
+    extras = {k: v for k, v in resultado.items() if k != "transportadoras"} if isinstance(resultado, dict) else {}
+    # O ID da coleta vai só no cabeçalho X-Coleta-Id: no corpo, mudaria o ETag a cada chamada
+    return {**extras, "since": since, "parcial": parcial,
+            **versoes.delta(escopo, transportadoras, since, parcial)}, coleta_id
+
+
+def responder(resultado, contadores, coleta_id):
+    resposta = com_contadores(jsonify(resultado), contadores)
+    if coleta_id is not None:
+        resposta.headers["X-Coleta-Id"] = str(coleta_id)
+    return resposta
+
+
+# ========== COMPRESSÃO E ETAG ==========
+COMPRESSAO_MINIMA = 1024  # bytes; respostas menores vão sem compressão
+CACHE_ETAGS_TTL = int(os.environ.get("CACHE_ETAGS_TTL", 300))  # segundos em que um ETag dispensa nova raspagem
+CACHE_ETAGS_MAX = 4096  # consultas lembradas
+ROTAS_COM_CACHE = {"/scripts", "/executar", "/catalogo"}
+
+# request.full_path -> (instante, etag do conteúdo, tamanho do corpo)
+_etags = OrderedDict()
+_etags_lock = threading.Lock()
+
+
+def codificacao_aceita():
+    aceitas = request.accept_encodings
+    if brotli is not None and aceitas["br"]:
+        return "br"
+    if aceitas["gzip"]:
+        return "gzip"
+    return None
+
+
+def etag_representacao(etag, tamanho):
+    codificacao = codificacao_aceita() if tamanho >= COMPRESSAO_MINIMA else None
+    return (f"{etag}-{codificacao}" if codificacao else etag), codificacao
+
+
+@app.before_request
+def responder_do_cache():
+    # Consulta repetida com If-None-Match dentro do TTL: 304 sem raspar de novo
+    if request.method != "GET" or request.path not in ROTAS_COM_CACHE or not request.if_none_match:
+        return None
+    if request.args.get("renovar", "false").lower() in ("1", "true", "sim"):
+        return None
+    with _etags_lock:
+        em_cache = _etags.get(request.full_path)
+    if em_cache is None or time.time() - em_cache[0] >= CACHE_ETAGS_TTL:
+        return None
+    etag, _ = etag_representacao(em_cache[1], em_cache[2])
+    if not request.if_none_match.contains(etag):
+        return None
+    resposta = Response(status=304)
+    resposta.set_etag(etag)
+    resposta.vary.add("Accept-Encoding")
+    return resposta
+
+
+def lembrar_etag(resposta, etag, tamanho):
+    if request.path not in ROTAS_COM_CACHE:
+        return
+    dados = resposta.get_json(silent=True)
+    if isinstance(dados, dict) and (dados.get("parcial") or "erro" in dados):
+        return  # resultado incompleto pode mudar na próxima chamada
+    with _etags_lock:
+        _etags[request.full_path] = (time.time(), etag, tamanho)
+        _etags.move_to_end(request.full_path)
+        while len(_etags) > CACHE_ETAGS_MAX:
+            _etags.popitem(last=False)
+
+
+@app.after_request
+def comprimir_resposta(resposta):
+    # Exportações em streaming e respostas já codificadas passam direto
+    if resposta.status_code != 200 or resposta.is_streamed or resposta.direct_passthrough \
+            or "Content-Encoding" in resposta.headers:
+        return resposta
+
+    corpo = resposta.get_data()
+    resposta.vary.add("Accept-Encoding")
+
+    # ETag forte por representação: o mesmo conteúdo em gzip e brotli tem bytes diferentes
+    etag = hashlib.blake2b(corpo, digest_size=16).hexdigest()
+    lembrar_etag(resposta, etag, len(corpo))
+    etag_repr, codificacao = etag_representacao(etag, len(corpo))
+    resposta.set_etag(etag_repr)
+    resposta.make_conditional(request)
+    if resposta.status_code == 304 or not codificacao:
+        return resposta
+
+    if codificacao == "br":
+        resposta.set_data(brotli.compress(corpo, quality=5))
+    else:
+        resposta.set_data(gzip.compress(corpo, compresslevel=6))
+    resposta.headers["Content-Encoding"] = codificacao
+    return resposta
+
+
 # ========== ENDPOINT: LISTAR SCRIPTS ==========
 @app.route("/scripts", methods=["GET"])
 def listar_scripts():
@@ -103,9 +267,29 @@ def executar_script():
         type: integer
         required: true
         description: Número da página a ser extraída
+      - name: deadline_ms
+        in: query
+        type: integer
+        required: false
+        description: Prazo máximo da execução em milissegundos. Ao expirar, retorna um objeto com `parcial` = true, `transportadoras` (o que foi resolvido até então) e `rotas_pendentes`, mais `listagem_pendente` com a URL da listagem se nem ela foi lida
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Retorna só as transportadoras adicionadas, alteradas (com diff por campo) ou removidas desde a coleta informada (ID de `X-Coleta-Id`, epoch em segundos ou data ISO)
     responses:
       200:
         description: Lista de transportadoras extraídas
+        headers:
+          X-Detalhes-Analisados:
+            type: integer
+            description: Páginas de detalhe analisadas pelo BeautifulSoup nesta execução
+          X-Detalhes-Reaproveitados:
+            type: integer
+            description: Páginas de detalhe idênticas à última coleta (registro reaproveitado do cache)
+          X-Coleta-Id:
+            type: integer
+            description: ID desta coleta, para usar em `since` nas próximas chamadas
         schema:
           type: array
           items:
@@ -155,18 +339,40 @@ def executar_script():
     try:
         id_script = int(request.args.get("id", 0))
         pagina = int(request.args.get("pagina", 1))
+        deadline_ms = request.args.get("deadline_ms")
+        since = request.args.get("since")
 
         if id_script not in SCRIPTS:
             return jsonify({"erro": f"ID {id_script} não encontrado. Use /scripts para listar os disponíveis."}), 400
+        if deadline_ms is not None:
+            try:
+                deadline_ms = ler_deadline_ms(deadline_ms)
+            except ValueError:
+                return jsonify({"erro": f"deadline_ms inválido: {deadline_ms}. Use um inteiro positivo em milissegundos."}), 400
+        if since is not None:
+            try:
+                versoes.resolver_since(since)
+            except ValueError:
+                return jsonify({"erro": f"since inválido: {since}. Use um ID de coleta, epoch ou data ISO."}), 400
 
         script_info = SCRIPTS[id_script]
         modulo = importlib.import_module(script_info["modulo"])
 
         print(f"🚀 Executando '{script_info['nome']}' | Página {pagina}...")
-        resultado = modulo.executar_pagina(pagina)
-        print(f"✅ Execução concluída ({script_info['nome']}, página {pagina})")
+        with cache_detalhes.contagem() as contadores:
+            if MOTOR == "async":
+                motor = importlib.import_module("motor_async")
+                resultado = motor.executar_pagina(modulo, pagina, prazo=Prazo(deadline_ms))
+            else:
+                resultado = modulo.executar_pagina(pagina, prazo=Prazo(deadline_ms))
+        if isinstance(resultado, dict) and resultado.get("parcial"):
+            print(f"⏱️ Prazo esgotado ({script_info['nome']}, página {pagina}) - resultado parcial")
+        else:
+            print(f"✅ Execução concluída ({script_info['nome']}, página {pagina})")
+        print(f"🧮 Detalhes: {contadores}")
 
-        return jsonify(resultado)
+        resultado, coleta_id = versionar(f"{script_info['modulo']}:{pagina}", serializar(resultado), since)
+        return responder(resultado, contadores, coleta_id)
 
     except Exception as e:
         traceback.print_exc()
@@ -176,6 +382,321 @@ def executar_script():
         }), 500
 
 
+# ========== ENDPOINT: CATÁLOGO VIA SITEMAP ==========
+@app.route("/catalogo", methods=["GET"])
+def catalogo():
+    """
+    Extrai transportadoras descobertas em massa pelo sitemap do portal, sem percorrer as rotas.
+    Se o portal não tiver sitemap, a descoberta cai para a varredura das rotas, feita aos poucos:
+    cada chamada percorre só as páginas de rotas necessárias para a página pedida e guarda onde parou.
+    Enquanto a varredura não termina, `descoberta_completa` é false e os totais são o mínimo conhecido.
+    As transportadoras vêm sem rotas; use `/executar` para o mapeamento origem/destino.
+
+    ---
+    tags:
+      - Scrapers
+    parameters:
+      - name: id
+        in: query
+        type: integer
+        required: true
+        description: ID do scraper (1 = Portal dos Fretes, 2 = Cargas.com.br, 3 = Guia do Transporte)
+      - name: pagina
+        in: query
+        type: integer
+        required: false
+        description: Página do catálogo (50 transportadoras por página)
+      - name: deadline_ms
+        in: query
+        type: integer
+        required: false
+        description: Prazo máximo da execução em milissegundos
+      - name: renovar
+        in: query
+        type: boolean
+        required: false
+        description: Ignora o cache e redescobre o catálogo
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Retorna só as transportadoras adicionadas, alteradas (com diff por campo) ou removidas desde a coleta informada (ID de `X-Coleta-Id`, epoch em segundos ou data ISO)
+    responses:
+      200:
+        description: Página do catálogo
+        schema:
+          type: object
+          properties:
+            fonte:
+              type: string
+              example: "sitemap"
+            pagina:
+              type: integer
+              example: 1
+            total_paginas:
+              type: integer
+              example: 120
+            total_transportadoras:
+              type: integer
+              example: 5987
+            descoberta_completa:
+              type: boolean
+              example: true
+            parcial:
+              type: boolean
+              example: false
+            links_pendentes:
+              type: array
+              items:
+                type: string
+            transportadoras:
+              type: array
+              items:
+                type: object
+    """
+    try:
+        id_script = int(request.args.get("id", 0))
+        pagina = int(request.args.get("pagina", 1))
+        deadline_ms = request.args.get("deadline_ms")
+        renovar = request.args.get("renovar", "false").lower() in ("1", "true", "sim")
+        since = request.args.get("since")
+
+        if id_script not in SCRIPTS:
+            return jsonify({"erro": f"ID {id_script} não encontrado. Use /scripts para listar os disponíveis."}), 400
+        if deadline_ms is not None:
+            try:
+                deadline_ms = ler_deadline_ms(deadline_ms)
+            except ValueError:
+                return jsonify({"erro": f"deadline_ms inválido: {deadline_ms}. Use um inteiro positivo em milissegundos."}), 400
+        if since is not None:
+            try:
+                versoes.resolver_since(since)
+            except ValueError:
+                return jsonify({"erro": f"since inválido: {since}. Use um ID de coleta, epoch ou data ISO."}), 400
+
+        script_info = SCRIPTS[id_script]
+        modulo = importlib.import_module(script_info["modulo"])
+        descoberta = importlib.import_module("descoberta")
+
+        print(f"🗺️ Catálogo '{script_info['nome']}' | Página {pagina}...")
+        with cache_detalhes.contagem() as contadores:
+            resultado = descoberta.executar_pagina(modulo, pagina, prazo=Prazo(deadline_ms), renovar=renovar)
+        print(f"✅ Catálogo concluído ({script_info['nome']}, página {pagina}, fonte {resultado['fonte']})")
+        print(f"🧮 Detalhes: {contadores}")
+
+        resultado, coleta_id = versionar(f"{script_info['modulo']}:catalogo:{pagina}", serializar(resultado), since)
+        return responder(resultado, contadores, coleta_id)
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            "erro": str(e),
+            "detalhes": traceback.format_exc()
+        }), 500
+
+
+# ========== ENDPOINT: RODADA DISTRIBUÍDA ==========
+@app.route("/rodadas", methods=["POST"])
+def criar_rodada():
+    """
+    Enfileira uma faixa de páginas de um scraper para os trabalhadores de todas as réplicas.
+    Cada página vira uma unidade arrendada por uma réplica; as transportadoras encontradas viram
+    unidades próprias, de modo que nenhuma réplica repete o trabalho de outra.
+
+    ---
+    tags:
+      - Distribuído
+    parameters:
+      - name: id
+        in: query
+        type: integer
+        required: true
+        description: ID do scraper (1 = Portal dos Fretes, 2 = Cargas.com.br, 3 = Guia do Transporte)
+      - name: inicio
+        in: query
+        type: integer
+        required: false
+        description: Primeira página (padrão 1)
+      - name: fim
+        in: query
+        type: integer
+        required: true
+        description: Última página
+    responses:
+      201:
+        description: Rodada criada
+        schema:
+          type: object
+          properties:
+            rodada:
+              type: integer
+              example: 7
+            paginas:
+              type: integer
+              example: 41
+    """
+    try:
+        id_script = int(request.args.get("id", 0))
+        inicio = int(request.args.get("inicio", 1))
+        fim = request.args.get("fim", type=int)
+
+        if id_script not in SCRIPTS:
+            return jsonify({"erro": f"ID {id_script} não encontrado. Use /scripts para listar os disponíveis."}), 400
+        if fim is None or fim < inicio:
+            return jsonify({"erro": "Informe fim >= inicio."}), 400
+
+        rodada_id = fila.abrir_fila().criar_rodada(SCRIPTS[id_script]["modulo"], inicio, fim)
+        print(f"📋 Rodada {rodada_id} criada ({SCRIPTS[id_script]['nome']}, páginas {inicio}-{fim})")
+        return jsonify({"rodada": rodada_id, "paginas": fim - inicio + 1}), 201
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            "erro": str(e),
+            "detalhes": traceback.format_exc()
+        }), 500
+
+
+@app.route("/rodadas/<int:rodada_id>", methods=["GET"])
+def status_rodada(rodada_id):
+    """
+    Progresso de uma rodada distribuída, por tipo de unidade e status.
+
+    ---
+    tags:
+      - Distribuído
+    parameters:
+      - name: rodada_id
+        in: path
+        type: integer
+        required: true
+    responses:
+      200:
+        description: Contagem de unidades
+        schema:
+          type: object
+          properties:
+            unidades:
+              type: object
+              example: {"pagina": {"concluida": 41}, "transportadora": {"concluida": 380, "arrendada": 12}}
+    """
+    fila_rodadas = fila.abrir_fila()
+    rodada = fila_rodadas.rodada(rodada_id)
+    if rodada is None:
+        return jsonify({"erro": f"Rodada {rodada_id} não encontrada."}), 404
+    return jsonify({**rodada, "unidades": fila_rodadas.resumo(rodada_id)})
+
+
+@app.route("/rodadas/<int:rodada_id>/resultado", methods=["GET"])
+def resultado_rodada(rodada_id):
+    """
+    Resultado de uma página da rodada, juntando o que as réplicas já concluíram.
+    Enquanto houver transportadoras na fila, retorna `{"parcial": true, "transportadoras": [...], "links_pendentes": [...]}`.
+
+    ---
+    tags:
+      - Distribuído
+    parameters:
+      - name: rodada_id
+        in: path
+        type: integer
+        required: true
+      - name: pagina
+        in: query
+        type: integer
+        required: true
+        description: Página da rodada
+      - name: since
+        in: query
+        type: string
+        required: false
+        description: Retorna só o delta desde a coleta informada (como em `/executar`). A página só é versionada depois de concluída; antes disso volta o resultado parcial
+    responses:
+      200:
+        description: Transportadoras da página (mesmo formato de `/executar`)
+    """
+    try:
+        pagina = int(request.args.get("pagina", 1))
+        since = request.args.get("since")
+        fila_rodadas = fila.abrir_fila()
+        rodada = fila_rodadas.rodada(rodada_id)
+        if rodada is None:
+            return jsonify({"erro": f"Rodada {rodada_id} não encontrada."}), 404
+        if not rodada["inicio"] <= pagina <= rodada["fim"]:
+            return jsonify({"erro": f"Página {pagina} fora da rodada ({rodada['inicio']}-{rodada['fim']})."}), 400
+        if since is not None:
+            try:
+                versoes.resolver_since(since)
+            except ValueError:
+                return jsonify({"erro": f"since inválido: {since}. Use um ID de coleta, epoch ou data ISO."}), 400
+
+        with cache_detalhes.contagem() as contadores:
+            resultado = serializar(fila.resultado_pagina(fila_rodadas, rodada_id, pagina))
+        # Página ainda aberta na fila: nada é versionado até todas as unidades fecharem
+        if isinstance(resultado, dict) and resultado.get("parcial"):
+            return responder(resultado, contadores, None)
+
+        # Página fechada: versiona uma vez só; as consultas seguintes reaproveitam a coleta
+        escopo = f"{rodada['modulo']}:{pagina}"
+        with _versionar_rodada_lock:
+            coleta_id = fila_rodadas.coleta_da_pagina(rodada_id, pagina)
+            resultado, coleta_id = versionar(escopo, resultado, since, coleta_id)
+            if coleta_id is not None:
+                fila_rodadas.marcar_coleta(rodada_id, pagina, coleta_id)
+        return responder(resultado, contadores, coleta_id)
+
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({
+            "erro": str(e),
+            "detalhes": traceback.format_exc()
+        }), 500
+
+
+# ========== ENDPOINT: EXPORTAÇÃO ==========
+@app.route("/export", methods=["GET"])
+def exportar_resultados():
+    """
+    Exporta o estado atual de todas as coletas, achatado em uma linha por transportadora × cidade de rota.
+    O arquivo é gerado em lotes durante a transferência, sem montar a exportação inteira em memória.
+
+    ---
+    tags:
+      - Exportação
+    parameters:
+      - name: formato
+        in: query
+        type: string
+        enum: ["csv", "ndjson", "parquet"]
+        required: false
+        description: Formato do arquivo (padrão csv; parquet requer pyarrow no servidor)
+      - name: id
+        in: query
+        type: integer
+        required: false
+        description: Exporta só um scraper (1 = Portal dos Fretes, 2 = Cargas.com.br, 3 = Guia do Transporte)
+    responses:
+      200:
+        description: Arquivo com as colunas modulo, origem_dados, pagina, coleta_id, nome, tipo_rota, cidade e os campos de detalhes
+    """
+    formato = request.args.get("formato", "csv").lower()
+    id_script = request.args.get("id", type=int)
+
+    if formato not in exportar.FORMATOS:
+        return jsonify({"erro": f"Formato {formato} inválido. Use {', '.join(exportar.FORMATOS)}."}), 400
+    if formato == "parquet" and exportar.pyarrow is None:
+        return jsonify({"erro": "Exportação em parquet requer o pacote pyarrow no servidor."}), 400
+    if id_script is not None and id_script not in SCRIPTS:
+        return jsonify({"erro": f"ID {id_script} não encontrado. Use /scripts para listar os disponíveis."}), 400
+
+    modulo = SCRIPTS[id_script]["modulo"] if id_script is not None else None
+    print(f"📤 Exportando {modulo or 'todos os scrapers'} em {formato}")
+    return Response(
+        exportar.exportar(formato, modulo),
+        mimetype=exportar.TIPOS[formato],
+        headers={"Content-Disposition": f"attachment; filename=transportadoras.{formato}"}
+    )
+
 
 # ========== ENDPOINT: HOME ==========
 @app.route("/", methods=["GET"])
@@ -197,11 +718,16 @@ def home():
     """
     return jsonify({
         "status": "API de Scrapers ativa",
-        "endpoints": ["/scripts", "/executar?id=<id>&pagina=<n>"],
+        "endpoints": ["/scripts", "/executar?id=<id>&pagina=<n>&deadline_ms=<ms>", "/catalogo?id=<id>&pagina=<n>",
+                      "POST /rodadas?id=<id>&inicio=<n>&fim=<n>", "/rodadas/<rodada>/resultado?pagina=<n>",
+                      "/export?formato=<csv|ndjson|parquet>"],
         "swagger_docs": "/apidocs"
     })
 
 
 # ========== RUN ==========
 if __name__ == "__main__":
+    # Com debug=True o reloader executa este bloco duas vezes; só o processo filho serve (e trabalha)
+    if fila.TRABALHADORES > 0 and os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        fila.iniciar_trabalhadores()
     app.run(host="0.0.0.0", port=5050, debug=True)
@@ -1,8 +1,9 @@
-import requests
 from bs4 import BeautifulSoup
-import time
 from urllib.parse import urljoin
 import re
+from prazo import Prazo, PrazoEsgotado, buscar, resultado_parcial
+from registros import Rota, Detalhes, Transportadora, compactar
+import cache_detalhes
 
 BASE = "https://portaldosfretes.com.br"
 
@@ -24,27 +25,36 @@ def decode_cfemail(cfemail):
 # ---------------------------
 # Extrair links de rotas
 # ---------------------------
-def extrair_links_rotas(pagina):
-    url = f"{BASE}/rotas/pagina-{pagina}"
-    resp = requests.get(url)
-    if resp.status_code != 200:
+def url_rotas(pagina):
+    return f"{BASE}/rotas/pagina-{pagina}"
+
+
+def parse_rotas(html):
+    if html is None:
         return []
-    soup = BeautifulSoup(resp.text, "html.parser")
-    links = []
+    soup = BeautifulSoup(html, "html.parser")
+    rotas = []
     for a in soup.select("a"):
         href = a.get("href")
         texto = a.get_text(strip=True)
         if href and texto.startswith(("Fretes de", "Frete de")):
-            links.append(urljoin(BASE, href))
-    return links
+            link = urljoin(BASE, href)
+            origem, destino = parse_rota_nome(link)
+            rotas.append(Rota.nova(origem, destino, link))
+    return rotas
+
+
+def extrair_links_rotas(pagina, prazo=None):
+    resp = buscar(url_rotas(pagina), prazo)
+    return parse_rotas(resp.text if resp.status_code == 200 else None)
 
 
 # ---------------------------
 # Descobrir número total de páginas
 # ---------------------------
-def get_total_paginas():
+def get_total_paginas(prazo=None):
     url = f"{BASE}/rotas/pagina-1"
-    resp = requests.get(url)
+    resp = buscar(url, prazo)
     if resp.status_code != 200:
         return 0
     soup = BeautifulSoup(resp.text, "html.parser")
@@ -79,14 +89,13 @@ def parse_rota_nome(rota_url):
 # ---------------------------
 # Extrair empresas da rota
 # ---------------------------
-def extrair_empresas_da_rota(rota_url):
-    resp = requests.get(rota_url)
-    if resp.status_code != 200:
+def parse_transportadoras(html, rota):
+    if html is None:
         return []
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     empresas = []
 
-    origem, destino = parse_rota_nome(rota_url)
+    origem, destino = rota.origem, rota.destino
 
     for bloco in soup.find_all("a", href=lambda h: h and "/transportadora/" in h):
         nome = bloco.get_text(strip=True)
@@ -111,14 +120,16 @@ def extrair_empresas_da_rota(rota_url):
     return empresas
 
 
+def extrair_empresas_da_rota(rota, prazo=None):
+    resp = buscar(rota.link, prazo)
+    return parse_transportadoras(resp.text if resp.status_code == 200 else None, rota)
+
+
 # ---------------------------
 # Extrair detalhes da transportadora
 # ---------------------------
-def extrair_detalhes_transportadora(url_transp):
-    resp = requests.get(url_transp)
-    if resp.status_code != 200:
-        return {}
-    soup = BeautifulSoup(resp.text, "html.parser")
+def parse_pagina_transportadora(html):
+    soup = BeautifulSoup(html, "html.parser")
     detalhes = {}
 
     # ---- Telefone ----
@@ -187,31 +198,65 @@ def extrair_detalhes_transportadora(url_transp):
     return detalhes
 
 
+def parse_detalhes(html, emp=None):
+    if html is None:
+        return {}
+    url = emp.get("link_transportadora") if emp else None
+    return cache_detalhes.reaproveitar(url, html, parse_pagina_transportadora)
+
+
+def extrair_detalhes_transportadora(url_transp, prazo=None):
+    try:
+        resp = buscar(url_transp, prazo)
+    except PrazoEsgotado:
+        raise
+    except Exception as e:
+        print(f"⚠️ Erro em {url_transp}: {e}")
+        return {}
+    return parse_detalhes(resp.text if resp.status_code == 200 else None, {"link_transportadora": url_transp})
+
+
 # ---------------------------
-# Função pública chamada pela API central
+# Agrupa (empresa, detalhes) por nome
 # ---------------------------
-def executar_pagina(pagina_num):
+def agregar(itens):
     empresas_map = {}
-    rotas = extrair_links_rotas(pagina_num)
-    for rota in rotas:
-        empresas = extrair_empresas_da_rota(rota)
-        for emp in empresas:
-            nome = emp["nome"]
-            if nome not in empresas_map:
-                empresas_map[nome] = {
-                    "nome": nome,
-                    "rotas": {"origens": [], "destinos": []},
-                    "detalhes": {}
-                }
-            if emp["rota_origem"]:
-                empresas_map[nome]["rotas"]["origens"].append(emp["rota_origem"])
-            if emp["rota_destino"]:
-                empresas_map[nome]["rotas"]["destinos"].append(emp["rota_destino"])
-            if not empresas_map[nome]["detalhes"] and emp["link_transportadora"]:
-                empresas_map[nome]["detalhes"] = extrair_detalhes_transportadora(emp["link_transportadora"])
-        time.sleep(0.5)
-
-    for emp in empresas_map.values():
-        emp["rotas"]["origens"] = list(set(emp["rotas"]["origens"]))
-        emp["rotas"]["destinos"] = list(set(emp["rotas"]["destinos"]))
-    return list(empresas_map.values())
+    for emp, detalhes in itens:
+        nome = emp["nome"]
+        if nome not in empresas_map:
+            empresas_map[nome] = Transportadora(nome)
+        transp = empresas_map[nome]
+        transp.adicionar_rota(emp["rota_origem"], emp["rota_destino"])
+        if not transp.detalhes and detalhes:
+            transp.detalhes = Detalhes.de_dict(detalhes)
+    return compactar(empresas_map.values())
+
+
+# ---------------------------
+# Função pública chamada pela API central
+# ---------------------------
+def executar_pagina(pagina_num, prazo=None):
+    prazo = prazo or Prazo()
+    itens = []
+    detalhes_por_nome = {}
+    pendentes = []
+    interrompido = False
+    rotas = None
+    try:
+        rotas = extrair_links_rotas(pagina_num, prazo)
+        for i, rota in enumerate(rotas):
+            pendentes = rotas[i:]
+            empresas = extrair_empresas_da_rota(rota, prazo)
+            for emp in empresas:
+                nome = emp["nome"]
+                if not detalhes_por_nome.get(nome) and emp["link_transportadora"]:
+                    detalhes_por_nome[nome] = extrair_detalhes_transportadora(emp["link_transportadora"], prazo)
+                itens.append((emp, detalhes_por_nome.get(nome)))
+            pendentes = []
+            prazo.dormir(0.5)
+    except PrazoEsgotado:
+        interrompido = True
+
+    if interrompido:
+        return resultado_parcial(agregar(itens), pendentes, None if rotas is not None else url_rotas(pagina_num))
+    return agregar(itens)
@@ -1,24 +1,29 @@
-import requests
 from bs4 import BeautifulSoup
 from urllib.parse import urljoin, unquote
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+import contextvars
 import re
-import time
+from prazo import Prazo, PrazoEsgotado, buscar, resultado_parcial
+from registros import Rota, Detalhes, Transportadora, compactar
+import cache_detalhes
 
 BASE = "https://cargas.com.br"
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 MAX_WORKERS = 8  # número de threads paralelas
+MENSAGEM_SEM_ROTAS = "Nenhuma rota encontrada na página {pagina}"
 
 
 # -------------------------------
 # Extrair rotas
 # -------------------------------
-def extrair_rotas(pagina):
-    url = f"{BASE}/rotas?page={pagina}"
-    resp = requests.get(url, headers=HEADERS)
-    if resp.status_code != 200:
+def url_rotas(pagina):
+    return f"{BASE}/rotas?page={pagina}"
+
+
+def parse_rotas(html):
+    if html is None:
         return []
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
 
     rotas = []
     for a in soup.find_all("a", href=True):
@@ -29,22 +34,22 @@ def extrair_rotas(pagina):
             if len(partes) == 2:
                 origem = partes[0].replace("-", " ").title()
                 destino = partes[1].replace("-", " ").title()
-                rotas.append({
-                    "origem": origem,
-                    "destino": destino,
-                    "link": urljoin(BASE, href)
-                })
+                rotas.append(Rota.nova(origem, destino, urljoin(BASE, href)))
     return rotas
 
 
+def extrair_rotas(pagina, prazo=None):
+    resp = buscar(url_rotas(pagina), prazo, headers=HEADERS)
+    return parse_rotas(resp.text if resp.status_code == 200 else None)
+
+
 # -------------------------------
 # Extrair transportadoras por rota
 # -------------------------------
-def extrair_transportadoras(rota):
-    resp = requests.get(rota["link"], headers=HEADERS)
-    if resp.status_code != 200:
+def parse_transportadoras(html, rota):
+    if html is None:
         return []
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
 
     empresas = []
     for a in soup.find_all("a", href=True):
@@ -54,18 +59,23 @@ def extrair_transportadoras(rota):
             if nome:
                 empresas.append({
                     "nome": nome,
-                    "origem": rota["origem"],
-                    "destino": rota["destino"],
+                    "origem": rota.origem,
+                    "destino": rota.destino,
                     "link_transportadora": link
                 })
     return empresas
 
 
+def extrair_transportadoras(rota, prazo=None):
+    resp = buscar(rota.link, prazo, headers=HEADERS)
+    return parse_transportadoras(resp.text if resp.status_code == 200 else None, rota)
+
+
 # -------------------------------
 # Extrair detalhes da transportadora individual
 # -------------------------------
-def extrair_detalhes_transportadora(emp):
-    detalhes = {
+def detalhes_vazios():
+    return {
         "cnpj": None,
         "inscricao_estadual": None,
         "endereco": None,
@@ -76,20 +86,18 @@ def extrair_detalhes_transportadora(emp):
         "imagem": None  # novo campo
     }
 
-    try:
-        resp = requests.get(emp["link_transportadora"], headers=HEADERS, timeout=15)
-        if resp.status_code != 200:
-            return {
-                "nome": emp["nome"],
-                "rotas": {"origens": [emp["origem"]], "destinos": [emp["destino"]]},
-                "detalhes": detalhes
-            }
 
-        soup = BeautifulSoup(resp.text, "html.parser")
+def parse_pagina_transportadora(html):
+    detalhes = detalhes_vazios()
+    nome_real = None
+
+    try:
+        soup = BeautifulSoup(html, "html.parser")
 
         # Nome completo
         nome_tag = soup.find("h1")
-        nome_real = nome_tag.get_text(strip=True) if nome_tag else emp["nome"]
+        if nome_tag:
+            nome_real = nome_tag.get_text(strip=True)
 
         # CNPJ e inscrição estadual
         cnpj_ie_tag = soup.select_one("#cargasAbout div div div:nth-of-type(3) div:nth-of-type(1) p:nth-of-type(1)")
@@ -140,24 +148,57 @@ def extrair_detalhes_transportadora(emp):
             detalhes["imagem"] = urljoin(BASE, img_tag["src"])
 
     except Exception as e:
-        print(f"⚠️ Erro em {emp.get('nome', 'desconhecido')}: {e}")
+        print(f"⚠️ Erro ao analisar {nome_real or 'transportadora'}: {e}")
+
+    return {"nome": nome_real, "detalhes": detalhes}
+
+
+def parse_detalhes(html, emp):
+    if html is None:
+        pagina = {"nome": None, "detalhes": detalhes_vazios()}
+    else:
+        pagina = cache_detalhes.reaproveitar(emp["link_transportadora"], html, parse_pagina_transportadora)
 
     return {
-        "nome": nome_real if 'nome_real' in locals() else emp.get("nome", ""),
+        "nome": pagina["nome"] or emp.get("nome", ""),
         "rotas": {
             "origens": [emp.get("origem")] if emp.get("origem") else [],
             "destinos": [emp.get("destino")] if emp.get("destino") else []
         },
-        "detalhes": detalhes
+        "detalhes": pagina["detalhes"]
     }
 
 
+def extrair_detalhes_transportadora(emp, prazo=None):
+    try:
+        resp = buscar(emp["link_transportadora"], prazo, headers=HEADERS)
+    except PrazoEsgotado:
+        raise
+    except Exception as e:
+        print(f"⚠️ Erro em {emp.get('nome', 'desconhecido')}: {e}")
+        return parse_detalhes(None, emp)
+    return parse_detalhes(resp.text if resp.status_code == 200 else None, emp)
+
+
+# -------------------------------
+# Agrupa os detalhes por nome real
+# -------------------------------
+def agregar(itens):
+    empresas_map = {}
+    for emp, dados in itens:
+        nome = dados["nome"]
+        if nome not in empresas_map:
+            empresas_map[nome] = Transportadora(nome, detalhes=Detalhes.de_dict(dados["detalhes"]))
+        empresas_map[nome].adicionar_rota(emp.get("origem"), emp.get("destino"))
+    return compactar(empresas_map.values())
+
+
 # -------------------------------
 # 🔹 Função pública: retorna total de páginas
 # -------------------------------
-def get_total_paginas():
+def get_total_paginas(prazo=None):
     url = f"{BASE}/rotas?page=1"
-    resp = requests.get(url, headers=HEADERS)
+    resp = buscar(url, prazo, headers=HEADERS)
     if resp.status_code != 200:
         return 0
 
@@ -174,40 +215,55 @@ def get_total_paginas():
 # -------------------------------
 # 🔹 Função pública: executa scraping de uma página
 # -------------------------------
-def executar_pagina(pagina_num):
-    rotas = extrair_rotas(pagina_num)
+def executar_pagina(pagina_num, prazo=None):
+    prazo = prazo or Prazo()
+    try:
+        rotas = extrair_rotas(pagina_num, prazo)
+    except PrazoEsgotado:
+        return resultado_parcial([], [], url_rotas(pagina_num))
     if not rotas:
-        return {"mensagem": f"Nenhuma rota encontrada na página {pagina_num}"}
-
-    empresas = []
-    for rota in rotas:
-        empresas.extend(extrair_transportadoras(rota))
-
-    resultados = []
+        return {"mensagem": MENSAGEM_SEM_ROTAS.format(pagina=pagina_num)}
+
+    pares = []
+    pendentes = []
+    for i, rota in enumerate(rotas):
+        try:
+            pares.extend((rota, emp) for emp in extrair_transportadoras(rota, prazo))
+        except PrazoEsgotado:
+            pendentes = rotas[i:]
+            break
+
+    resultados = {}
     with ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
-        futures = [executor.submit(extrair_detalhes_transportadora, emp) for emp in empresas]
-        for future in as_completed(futures):
-            data = future.result()
-            if data:
-                resultados.append(data)
-
-    empresas_map = {}
-    for emp in resultados:
-        nome = emp["nome"]
-        if nome not in empresas_map:
-            empresas_map[nome] = {
-                "nome": nome,
-                "rotas": {"origens": [], "destinos": []},
-                "detalhes": emp["detalhes"]
-            }
-        empresas_map[nome]["rotas"]["origens"].extend(emp["rotas"]["origens"])
-        empresas_map[nome]["rotas"]["destinos"].extend(emp["rotas"]["destinos"])
-
-    for emp in empresas_map.values():
-        emp["rotas"]["origens"] = list(set(emp["rotas"]["origens"]))
-        emp["rotas"]["destinos"] = list(set(emp["rotas"]["destinos"]))
+        futures = {
+            executor.submit(contextvars.copy_context().run, extrair_detalhes_transportadora, emp, prazo): (rota, emp)
+            for rota, emp in pares
+        }
+        try:
+            for future in as_completed(futures, timeout=prazo.restante()):
+                try:
+                    data = future.result()
+                except PrazoEsgotado:
+                    continue
+                if data:
+                    resultados[future] = data
+        except FuturesTimeout:
+            pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # Ordem de submissão (não de conclusão): mesma página → mesmo resultado
+    itens = [(emp, resultados[future]) for future, (_, emp) in futures.items() if future in resultados]
+
+    # Rotas com alguma transportadora sem detalhes ficam pendentes
+    for future, (rota, _) in futures.items():
+        concluida = future.done() and not future.cancelled() and future.exception() is None
+        if not concluida and rota not in pendentes:
+            pendentes.append(rota)
+
+    if pendentes:
+        return resultado_parcial(agregar(itens), pendentes)
 
     # Pequena pausa de segurança
-    time.sleep(0.3)
+    prazo.dormir(0.3)
 
-    return list(empresas_map.values())
+    return agregar(itens)
@@ -1,31 +1,36 @@
 import requests
 from bs4 import BeautifulSoup
 import re
-import time
 from urllib.parse import urljoin
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from prazo import Prazo, PrazoEsgotado, buscar, resultado_parcial
+from registros import Rota, Detalhes, Transportadora, compactar
+import cache_detalhes
 
 BASE = "https://www.guiadotransporte.com.br"
 HEADERS = {"User-Agent": "Mozilla/5.0"}
 LIMITE_ROTAS = None
 MAX_WORKERS = 10
+MENSAGEM_SEM_ROTAS = "Nenhuma rota encontrada na página {pagina}"
 session = requests.Session()
 session.headers.update(HEADERS)
 
 # Variável global para armazenar a rota atual
-ROTA_ATUAL = {"origem": None, "destino": None}
+ROTA_ATUAL = Rota()
 
 
 # ----------------------------
 # Extrai as rotas (origem/destino)
 # ----------------------------
-def extrair_links_rotas(pagina):
-    url = f"{BASE}/cotacao-transportadora/origem-e-destino?page={pagina}"
-    resp = requests.get(url, headers=HEADERS)
-    if resp.status_code != 200:
+def url_rotas(pagina):
+    return f"{BASE}/cotacao-transportadora/origem-e-destino?page={pagina}"
+
+
+def parse_rotas(html):
+    if html is None:
         return []
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     rotas = []
 
     for a in soup.select("div.grid a[href*='/rotas/']"):
@@ -41,27 +46,24 @@ def extrair_links_rotas(pagina):
         else:
             origem, destino = None, None
 
-        rotas.append({
-            "origem": origem,
-            "destino": destino,
-            "link": urljoin(BASE, href)
-        })
+        rotas.append(Rota.nova(origem, destino, urljoin(BASE, href)))
 
     return rotas
 
 
+def extrair_links_rotas(pagina, prazo=None):
+    resp = buscar(url_rotas(pagina), prazo, headers=HEADERS)
+    return parse_rotas(resp.text if resp.status_code == 200 else None)
+
+
 # ----------------------------
 # Extrai as transportadoras de cada rota
 # ----------------------------
-def extrair_transportadoras_da_rota(rota):
-    global ROTA_ATUAL
-    ROTA_ATUAL = rota
-
-    resp = requests.get(rota["link"], headers=HEADERS)
-    if resp.status_code != 200:
+def parse_transportadoras(html, rota):
+    if html is None:
         return []
 
-    soup = BeautifulSoup(resp.text, "html.parser")
+    soup = BeautifulSoup(html, "html.parser")
     empresas = []
     links_vistos = set()
 
@@ -83,19 +85,27 @@ def extrair_transportadoras_da_rota(rota):
 
         empresas.append({
             "nome": nome,
-            "origem": rota["origem"],
-            "destino": rota["destino"],
+            "origem": rota.origem,
+            "destino": rota.destino,
             "link_transportadora": href_full
         })
 
     return empresas
 
 
+def extrair_transportadoras_da_rota(rota, prazo=None):
+    global ROTA_ATUAL
+    ROTA_ATUAL = rota
+
+    resp = buscar(rota.link, prazo, headers=HEADERS)
+    return parse_transportadoras(resp.text if resp.status_code == 200 else None, rota)
+
+
 # ----------------------------
 # Extrai os detalhes de uma transportadora
 # ----------------------------
-def extrair_detalhes_transportadora(emp):
-    detalhes = {
+def detalhes_vazios():
+    return {
         "cnpj": None,
         "inscricao_estadual": None,
         "endereco": None,
@@ -106,27 +116,12 @@ def extrair_detalhes_transportadora(emp):
         "imagem": None
     }
 
-    nome_real = emp.get("nome", "")
-    url = emp["link_transportadora"]
 
-    try:
-        # -------------------------------
-        # 🔁 Retentativas leves (3x) com tempo curto
-        # -------------------------------
-        for tentativa in range(3):
-            try:
-                resp = session.get(url, timeout=15)
-                if resp.status_code == 200:
-                    break
-            except requests.exceptions.RequestException:
-                if tentativa < 2:
-                    time.sleep(1)
-                    continue
-                return montar_objeto(emp, detalhes)
-        else:
-            return montar_objeto(emp, detalhes)
+def parse_pagina_transportadora(html):
+    detalhes = detalhes_vazios()
+    nome_real = None
 
-        html = resp.text
+    try:
         soup = BeautifulSoup(html, "lxml")  # parser mais rápido
 
         # Nome
@@ -177,18 +172,47 @@ def extrair_detalhes_transportadora(emp):
             detalhes["whatsapp"] = ws_tag["href"]
 
     except Exception as e:
-        print(f"⚠️ Erro em {emp.get('nome', 'desconhecido')}: {e}")
+        print(f"⚠️ Erro ao analisar {nome_real or 'transportadora'}: {e}")
+
+    return {"nome": nome_real, "detalhes": detalhes}
+
+
+def parse_detalhes(html, emp):
+    if html is None:
+        return montar_objeto(emp, detalhes_vazios())
 
+    pagina = cache_detalhes.reaproveitar(emp["link_transportadora"], html, parse_pagina_transportadora)
     return montar_objeto(
         {
-            "nome": nome_real,
-            "origem": emp.get("origem") or ROTA_ATUAL.get("origem"),
-            "destino": emp.get("destino") or ROTA_ATUAL.get("destino")
+            "nome": pagina["nome"] or emp.get("nome", ""),
+            "origem": emp.get("origem") or ROTA_ATUAL.origem,
+            "destino": emp.get("destino") or ROTA_ATUAL.destino
         },
-        detalhes
+        pagina["detalhes"]
     )
 
 
+def extrair_detalhes_transportadora(emp, prazo=None):
+    prazo = prazo or Prazo()
+
+    # -------------------------------
+    # 🔁 Retentativas leves (3x) com tempo curto
+    # -------------------------------
+    for tentativa in range(3):
+        try:
+            resp = buscar(emp["link_transportadora"], prazo, cliente=session)
+            if resp.status_code == 200:
+                break
+        except requests.exceptions.RequestException:
+            if tentativa < 2:
+                prazo.dormir(1)
+                continue
+            return parse_detalhes(None, emp)
+    else:
+        return parse_detalhes(None, emp)
+
+    return parse_detalhes(resp.text, emp)
+
 
 # ----------------------------
 # Monta objeto final
@@ -207,9 +231,9 @@ def montar_objeto(emp, detalhes):
 # ----------------------------
 # 🔹 Retorna total de páginas
 # ----------------------------
-def get_total_paginas():
+def get_total_paginas(prazo=None):
     url = f"{BASE}/cotacao-transportadora/origem-e-destino?page=1"
-    resp = requests.get(url, headers=HEADERS)
+    resp = buscar(url, prazo, headers=HEADERS)
     if resp.status_code != 200:
         return 0
 
@@ -224,55 +248,69 @@ def get_total_paginas():
 
 
 # ----------------------------
-# 🔹 Executa scraping de uma página
+# Agrupa (empresa, detalhes) por nome
 # ----------------------------
-def executar_pagina(pagina):
+def agregar(itens):
     empresas_map = {}
-    rotas = extrair_links_rotas(pagina)
-    if not rotas:
-        return {"mensagem": f"Nenhuma rota encontrada na página {pagina}"}
+    for emp, detalhes_completos in itens:
+        nome_base = emp["nome"].strip()
+        nome_final = detalhes_completos["nome"].strip()
 
-    for rota in rotas:
-        print(f"\n🌍 Rota: {rota['origem']} → {rota['destino']}")
-        empresas = extrair_transportadoras_da_rota(rota)
-        if not empresas:
-            continue
-
-        for emp in empresas:
-            print(f"🔎 {emp['nome']}")
-            detalhes_completos = extrair_detalhes_transportadora(emp)
+        if nome_base not in empresas_map:
+            empresas_map[nome_base] = Transportadora(nome_base)
 
-            nome_base = emp["nome"].strip()
-            nome_final = detalhes_completos["nome"].strip()
+        # Rotas
+        empresas_map[nome_base].adicionar_rota(emp.get("origem"), emp.get("destino"))
 
-            if nome_base not in empresas_map:
-                empresas_map[nome_base] = {
-                    "nome": nome_base,
-                    "rotas": {"origens": [], "destinos": []},
-                    "detalhes": {}
-                }
+        # Atualiza nome se necessário
+        if nome_final and nome_final != nome_base:
+            empresas_map[nome_final] = empresas_map.pop(nome_base)
+            empresas_map[nome_final].nome = nome_final
+            nome_base = nome_final
 
-            # Rotas
-            if emp.get("origem") and emp["origem"] not in empresas_map[nome_base]["rotas"]["origens"]:
-                empresas_map[nome_base]["rotas"]["origens"].append(emp["origem"])
-            if emp.get("destino") and emp["destino"] not in empresas_map[nome_base]["rotas"]["destinos"]:
-                empresas_map[nome_base]["rotas"]["destinos"].append(emp["destino"])
+        empresas_map[nome_base].detalhes = Detalhes.de_dict(detalhes_completos["detalhes"])
 
-            # Atualiza nome se necessário
-            if nome_final and nome_final != nome_base:
-                empresas_map[nome_final] = empresas_map.pop(nome_base)
-                empresas_map[nome_final]["nome"] = nome_final
-                nome_base = nome_final
+    return compactar(empresas_map.values())
 
-            empresas_map[nome_base]["detalhes"] = detalhes_completos["detalhes"]
 
-            # Delay mínimo para estabilidade, mas quase imperceptível
-            time.sleep(0.2)
+# ----------------------------
+# 🔹 Executa scraping de uma página
+# ----------------------------
+def executar_pagina(pagina, prazo=None):
+    prazo = prazo or Prazo()
+    itens = []
+    try:
+        rotas = extrair_links_rotas(pagina, prazo)
+    except PrazoEsgotado:
+        return resultado_parcial([], [], url_rotas(pagina))
+    if not rotas:
+        return {"mensagem": MENSAGEM_SEM_ROTAS.format(pagina=pagina)}
+
+    pendentes = []
+    for i, rota in enumerate(rotas):
+        print(f"\n🌍 Rota: {rota.origem} → {rota.destino}")
+        try:
+            empresas = extrair_transportadoras_da_rota(rota, prazo)
+        except PrazoEsgotado:
+            pendentes = rotas[i:]
+            break
+        if not empresas:
+            continue
 
-    for emp in empresas_map.values():
-        emp["rotas"]["origens"] = sorted(set(emp["rotas"]["origens"]))
-        emp["rotas"]["destinos"] = sorted(set(emp["rotas"]["destinos"]))
+        for emp in empresas:
+            print(f"🔎 {emp['nome']}")
+            try:
+                itens.append((emp, extrair_detalhes_transportadora(emp, prazo)))
+            except PrazoEsgotado:
+                pendentes = rotas[i:]
+                break
 
-    return list(empresas_map.values())
+            # Delay mínimo para estabilidade, mas quase imperceptível
+            prazo.dormir(0.2)
 
+        if pendentes:
+            break
 
+    if pendentes:
+        return resultado_parcial(agregar(itens), pendentes)
+    return agregar(itens)
@@ -0,0 +1,191 @@
+import argparse
+import glob
+import gzip
+import importlib
+import json
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from registros import serializar
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ARQUIVAR = os.environ.get("ARQUIVAR_HTML", "0").lower() in ("1", "true", "sim")
+ARQUIVO_DIR = os.environ.get("ARQUIVO_DIR", os.path.join("logs", "arquivo"))
+SEGMENTO_MAX = 256 * 1024 * 1024  # bytes por arquivo de segmento
+
+
+# ---------------------------
+# Compressão (zstd se instalado, senão gzip)
+# ---------------------------
+def comprimir(dados):
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=6).compress(dados)
+    return "gzip", gzip.compress(dados, compresslevel=6)
+
+
+def descomprimir(compressao, dados):
+    if compressao == "zstd":
+        if zstandard is None:
+            raise RuntimeError("Arquivo comprimido com zstd, mas o pacote zstandard não está instalado")
+        return zstandard.ZstdDecompressor().decompress(dados)
+    return gzip.decompress(dados)
+
+
+# ---------------------------
+# Escrita: segmentos append-only + índice de offsets (um por processo)
+# ---------------------------
+class Gravador:
+    def __init__(self, diretorio=ARQUIVO_DIR):
+        self.diretorio = diretorio
+        self.prefixo = f"{socket.gethostname()}-{os.getpid()}"
+        self.lock = threading.Lock()
+        self.numero = 0
+        self.segmento = None
+        os.makedirs(diretorio, exist_ok=True)
+        self.indice = open(os.path.join(diretorio, f"indice-{self.prefixo}.jsonl"), "a", encoding="utf-8")
+        self._abrir_segmento()
+
+    def _abrir_segmento(self):
+        if self.segmento:
+            self.segmento.close()
+        self.numero += 1
+        self.nome_segmento = f"segmento-{self.prefixo}-{self.numero:05d}.bin"
+        self.segmento = open(os.path.join(self.diretorio, self.nome_segmento), "ab")
+
+    def gravar(self, url, conteudo, encoding=None):
+        compressao, blob = comprimir(conteudo)
+        with self.lock:
+            if self.segmento.tell() + len(blob) > SEGMENTO_MAX:
+                self._abrir_segmento()
+            offset = self.segmento.tell()
+            self.segmento.write(blob)
+            self.segmento.flush()
+            self.indice.write(json.dumps({
+                "url": url,
+                "segmento": self.nome_segmento,
+                "offset": offset,
+                "tamanho": len(blob),
+                "compressao": compressao,
+                "encoding": encoding or "utf-8",
+                "ts": time.time()
+            }) + "\n")
+            self.indice.flush()
+
+
+_gravador = None
+_gravador_lock = threading.Lock()
+
+
+def arquivar(url, conteudo, encoding=None):
+    global _gravador
+    if not ARQUIVAR:
+        return
+    with _gravador_lock:
+        if _gravador is None or _gravador.prefixo != f"{socket.gethostname()}-{os.getpid()}":
+            _gravador = Gravador()
+    try:
+        _gravador.gravar(url, conteudo, encoding)
+    except OSError as e:
+        print(f"⚠️ Falha ao arquivar {url}: {e}")
+
+
+# ---------------------------
+# Leitura: última versão de cada URL
+# ---------------------------
+class Leitor:
+    def __init__(self, diretorio=ARQUIVO_DIR):
+        self.diretorio = diretorio
+        self.entradas = {}
+        for caminho in sorted(glob.glob(os.path.join(diretorio, "indice-*.jsonl"))):
+            with open(caminho, encoding="utf-8") as f:
+                for linha in f:
+                    try:
+                        entrada = json.loads(linha)
+                    except ValueError:
+                        continue  # linha truncada por queda do processo
+                    anterior = self.entradas.get(entrada["url"])
+                    if anterior is None or entrada["ts"] >= anterior["ts"]:
+                        self.entradas[entrada["url"]] = entrada
+
+    def __contains__(self, url):
+        return url in self.entradas
+
+    def html(self, url):
+        entrada = self.entradas.get(url)
+        if entrada is None:
+            return None
+        with open(os.path.join(self.diretorio, entrada["segmento"]), "rb") as f:
+            f.seek(entrada["offset"])
+            blob = f.read(entrada["tamanho"])
+        return descomprimir(entrada["compressao"], blob).decode(entrada["encoding"], errors="replace")
+
+
+# ---------------------------
+# Re-extração offline de uma página de rotas
+# ---------------------------
+_leitor = None
+
+
+def _reextrair_pagina(nome_modulo, pagina, diretorio):
+    global _leitor
+    if _leitor is None or _leitor.diretorio != diretorio:
+        _leitor = Leitor(diretorio)
+    modulo = importlib.import_module(nome_modulo)
+
+    detalhes_por_link = {}
+    itens = []
+    for rota in modulo.parse_rotas(_leitor.html(modulo.url_rotas(pagina))):
+        for emp in modulo.parse_transportadoras(_leitor.html(rota.link), rota):
+            link = emp["link_transportadora"]
+            if link not in detalhes_por_link:
+                detalhes_por_link[link] = modulo.parse_detalhes(_leitor.html(link), emp)
+            itens.append((emp, detalhes_por_link[link]))
+
+    return {"modulo": nome_modulo, "pagina": pagina, "transportadoras": serializar(modulo.agregar(itens))}
+
+
+def paginas_arquivadas(modulo, leitor):
+    # Nunca há mais páginas de rotas do que entradas no índice
+    return [p for p in range(1, len(leitor.entradas) + 1) if modulo.url_rotas(p) in leitor]
+
+
+def reextrair(nome_modulo, diretorio=ARQUIVO_DIR, processos=None, saida=sys.stdout):
+    modulo = importlib.import_module(nome_modulo)
+    paginas = paginas_arquivadas(modulo, Leitor(diretorio))
+    print(f"📦 {len(paginas)} páginas de '{nome_modulo}' no arquivo {diretorio}", file=sys.stderr)
+
+    total = 0
+    with ProcessPoolExecutor(max_workers=processos) as executor:
+        resultados = executor.map(_reextrair_pagina, [nome_modulo] * len(paginas), paginas, [diretorio] * len(paginas))
+        for resultado in resultados:
+            total += len(resultado["transportadoras"])
+            saida.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+    print(f"✅ {total} transportadoras re-extraídas", file=sys.stderr)
+
+
+# ---------------------------
+# CLI: python arquivo.py reextrair --modulo app2 --saida app2.ndjson
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Arquivo de HTML bruto e re-extração offline")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p_re = sub.add_parser("reextrair", help="Roda os extratores atuais sobre o HTML arquivado, sem rede")
+    p_re.add_argument("--modulo", required=True, help="Módulo do scraper (app, app2, app3)")
+    p_re.add_argument("--diretorio", default=ARQUIVO_DIR)
+    p_re.add_argument("--processos", type=int, default=None, help="Processos paralelos (padrão: nº de CPUs)")
+    p_re.add_argument("--saida", default="-", help="Arquivo NDJSON de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    if args.comando == "reextrair":
+        if args.saida == "-":
+            reextrair(args.modulo, args.diretorio, args.processos)
+        else:
+            with open(args.saida, "w", encoding="utf-8") as f:
+                reextrair(args.modulo, args.diretorio, args.processos, f)
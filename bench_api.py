@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from prazo import Prazo
+from registros import Detalhes, Transportadora, compactar
+
+# ---------------------------
+# Teste de carga da API com scrapers substitutos (sem rede):
+#   python bench_api.py --concorrencia 32 --requisicoes 2000 --latencia-ms 50 --transportadoras 100
+# ---------------------------
+PORTA = 5099
+ENDPOINTS = ["/", "/scripts", "/executar"]
+TOTAL_PAGINAS = 41
+
+
+# ---------------------------
+# Scraper substituto: latência e tamanho de página configuráveis, resultado determinístico
+# ---------------------------
+def substituto(script_id, latencia_ms, n_transportadoras):
+    modulo = types.ModuleType(f"substituto{script_id}")
+
+    def get_total_paginas(prazo=None):
+        (prazo or Prazo()).dormir(latencia_ms / 1000.0)
+        return TOTAL_PAGINAS
+
+    def executar_pagina(pagina_num, prazo=None):
+        (prazo or Prazo()).dormir(latencia_ms / 1000.0)
+        rng = random.Random(f"{script_id}:{pagina_num}")
+        transportadoras = []
+        for i in range(n_transportadoras):
+            transp = Transportadora(f"Transportadora {script_id}-{pagina_num}-{i}", detalhes=Detalhes.de_dict({
+                "telefone": f"(11) 9{rng.randrange(10 ** 8):08d}",
+                "email": f"contato{i}@exemplo.com.br",
+                "endereco": f"Rua {rng.randrange(1000)}, {i} - São Paulo/SP",
+                "cnpj": f"12.345.{i % 1000:03d}/0001-90"
+            }))
+            for _ in range(5):
+                transp.adicionar_rota(f"Cidade {rng.randrange(500)} - SP", f"Cidade {rng.randrange(500)} - RJ")
+            transportadoras.append(transp)
+        return compactar(transportadoras)
+
+    modulo.get_total_paginas = get_total_paginas
+    modulo.executar_pagina = executar_pagina
+    return modulo
+
+
+def servir(porta, latencia_ms, n_transportadoras, processos):
+    import api_transportadoras as api
+
+    api.MOTOR = "sync"
+    for script_id, dados in api.SCRIPTS.items():
+        modulo = substituto(script_id, latencia_ms, n_transportadoras)
+        sys.modules[modulo.__name__] = modulo
+        dados["modulo"] = modulo.__name__
+
+    api.app.logger.disabled = True
+    # processes=N do werkzeug não é um pool pré-fork: faz fork de um filho por requisição,
+    # com no máximo N filhos ao mesmo tempo
+    if processos > 1:
+        api.app.run(host="127.0.0.1", port=porta, threaded=False, processes=processos)
+    else:
+        api.app.run(host="127.0.0.1", port=porta, threaded=True)
+
+
+# ---------------------------
+# Memória residente do servidor; no modo fork por requisição soma os filhos vivos no instante
+# da amostra (processos curtos, que compartilham páginas copy-on-write com o pai)
+# ---------------------------
+def rss_mb(pid):
+    total = 0
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        pass
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/status") as f:
+                for linha in f:
+                    if linha.startswith("VmRSS:"):
+                        total += int(linha.split()[1])
+        except OSError:
+            continue
+    return total / 1024 if total else None
+
+
+class AmostradorRSS(threading.Thread):
+    def __init__(self, pid, intervalo=0.2):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.intervalo = intervalo
+        self.amostras = []
+        self.parar = threading.Event()
+
+    def run(self):
+        while not self.parar.wait(self.intervalo):
+            rss = rss_mb(self.pid)
+            if rss is not None:
+                self.amostras.append(rss)
+
+
+# ---------------------------
+# Cliente de carga
+# ---------------------------
+def percentil(valores, p):
+    if not valores:
+        return None
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(len(ordenados) * p / 100))]
+
+
+def disparar(base, endpoints, requisicoes, concorrencia, comprimir, semente=42):
+    rng = random.Random(semente)
+    alvos = []
+    for i in range(requisicoes):
+        endpoint = endpoints[i % len(endpoints)]
+        if endpoint == "/executar":
+            endpoint += f"?id={rng.randint(1, 3)}&pagina={rng.randint(1, TOTAL_PAGINAS)}"
+        alvos.append(endpoint)
+
+    local = threading.local()
+    headers = {} if comprimir else {"Accept-Encoding": "identity"}
+
+    def requisitar(alvo):
+        if not hasattr(local, "sessao"):
+            local.sessao = requests.Session()
+        inicio = time.perf_counter()
+        try:
+            ok = local.sessao.get(base + alvo, headers=headers, timeout=60).status_code < 400
+        except requests.exceptions.RequestException:
+            ok = False
+        return alvo.split("?")[0], (time.perf_counter() - inicio) * 1000, ok
+
+    inicio = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        resultados = list(executor.map(requisitar, alvos))
+    return resultados, time.perf_counter() - inicio
+
+
+def resumir(resultados, duracao):
+    grupos = {"total": resultados}
+    for resultado in resultados:
+        grupos.setdefault(resultado[0], []).append(resultado)
+
+    resumo = {}
+    for nome, itens in grupos.items():
+        latencias = [ms for _, ms, _ in itens]
+        erros = sum(1 for _, _, ok in itens if not ok)
+        resumo[nome] = {
+            "requisicoes": len(itens),
+            "vazao_rps": round(len(itens) / duracao, 1),
+            "p50_ms": round(percentil(latencias, 50), 1),
+            "p95_ms": round(percentil(latencias, 95), 1),
+            "p99_ms": round(percentil(latencias, 99), 1),
+            "taxa_erro": round(erros / len(itens), 4)
+        }
+    return resumo
+
+
+def descrever_modo(processos):
+    return "threads" if processos <= 1 else f"fork por requisição (até {processos} filhos)"
+
+
+def imprimir(resumo, rss, args):
+    print(f"\n📊 concorrência {args.concorrencia} | {args.requisicoes} requisições | latência do scraper "
+          f"{args.latencia_ms} ms | {args.transportadoras} transportadoras/página | servidor {descrever_modo(args.processos)}")
+    print(f"{'endpoint':<12}{'req':>7}{'req/s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'erros':>8}")
+    for nome, r in resumo.items():
+        print(f"{nome:<12}{r['requisicoes']:>7}{r['vazao_rps']:>9}{r['p50_ms']:>9}{r['p95_ms']:>9}"
+              f"{r['p99_ms']:>9}{r['taxa_erro']:>8.2%}")
+    if rss["inicial_mb"] is not None:
+        rotulo = "RSS do servidor" if args.processos <= 1 else "RSS do servidor + filhos vivos"
+        print(f"{rotulo}: {rss['inicial_mb']:.1f} MiB no início, pico {rss['pico_mb']:.1f} MiB, "
+              f"{rss['final_mb']:.1f} MiB no fim")
+
+
+def aguardar_servidor(base, processo, limite=30):
+    fim = time.monotonic() + limite
+    while time.monotonic() < fim:
+        if processo.poll() is not None:
+            raise RuntimeError("Servidor encerrou antes de ficar pronto")
+        try:
+            requests.get(base + "/", timeout=1)
+            return
+        except requests.exceptions.RequestException:
+            time.sleep(0.2)
+    raise RuntimeError("Servidor não respondeu a tempo")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API com scrapers substitutos")
+    parser.add_argument("--concorrencia", type=int, default=16)
+    parser.add_argument("--requisicoes", type=int, default=1000)
+    parser.add_argument("--endpoints", default=",".join(ENDPOINTS), help="Lista separada por vírgulas")
+    parser.add_argument("--latencia-ms", type=int, default=50, help="Latência simulada de cada scraper")
+    parser.add_argument("--transportadoras", type=int, default=100, help="Transportadoras por página (tamanho da resposta)")
+    parser.add_argument("--processos", type=int, default=1,
+                        help="1 = servidor werkzeug com threads; N = werkzeug com fork por requisição, até N filhos "
+                             "simultâneos (não é um pool pré-fork como gunicorn)")
+    parser.add_argument("--sem-compressao", action="store_true", help="Não envia Accept-Encoding: gzip")
+    parser.add_argument("--porta", type=int, default=PORTA)
+    parser.add_argument("--json", default=None, help="Grava o resumo neste arquivo")
+    args = parser.parse_args()
+    if args.requisicoes < 1:
+        parser.error("--requisicoes deve ser pelo menos 1")
+    if args.concorrencia < 1:
+        parser.error("--concorrencia deve ser pelo menos 1")
+    if args.latencia_ms < 0 or args.transportadoras < 0:
+        parser.error("--latencia-ms e --transportadoras não podem ser negativos")
+
+    # Bancos de cache/versões/fila do servidor isolados dos dados reais
+    diretorio = tempfile.mkdtemp(prefix="bench_api-")
+    ambiente = {
+        **os.environ,
+        "CACHE_DETALHES_DB": os.path.join(diretorio, "cache_detalhes.sqlite3"),
+        "VERSOES_DB": os.path.join(diretorio, "versoes.sqlite3"),
+        "FILA_DB": os.path.join(diretorio, "fila.sqlite3"),
+        "ARQUIVAR_HTML": "0"
+    }
+    comando = [sys.executable, os.path.abspath(__file__), "--servir", str(args.porta), str(args.latencia_ms),
+               str(args.transportadoras), str(args.processos)]
+    processo = subprocess.Popen(comando, env=ambiente, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f"http://127.0.0.1:{args.porta}"
+    try:
+        aguardar_servidor(base, processo)
+        amostrador = AmostradorRSS(processo.pid)
+        inicial = rss_mb(processo.pid)
+        amostrador.start()
+        resultados, duracao = disparar(base, args.endpoints.split(","), args.requisicoes, args.concorrencia,
+                                       not args.sem_compressao)
+        amostrador.parar.set()
+        final = rss_mb(processo.pid)
+    finally:
+        processo.terminate()
+        processo.wait()
+
+    resumo = resumir(resultados, duracao)
+    rss = {"inicial_mb": inicial, "pico_mb": max(amostrador.amostras + [final or 0]), "final_mb": final}
+    imprimir(resumo, rss, args)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({"parametros": vars(args), "modo_servidor": descrever_modo(args.processos), "resumo": resumo, "rss": rss}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 6 and sys.argv[1] == "--servir":
+        servir(*map(int, sys.argv[2:]))
+    else:
+        main()
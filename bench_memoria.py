@@ -0,0 +1,76 @@
+import random
+import tracemalloc
+from registros import Detalhes, Transportadora, compactar, serializar
+
+# ---------------------------
+# Mede o pico de memória para acumular N transportadoras
+# em um crawl de várias páginas (dicts x registros compactos)
+# ---------------------------
+N_TRANSPORTADORAS = 10_000
+POR_PAGINA = 100
+ROTAS_POR_TRANSPORTADORA = 20
+N_CIDADES = 500
+
+CIDADES = [f"cidade {i} - sp" for i in range(N_CIDADES)]
+
+
+def _rotas(rng):
+    # .title() devolve uma string nova a cada chamada, como no parse do HTML
+    for _ in range(ROTAS_POR_TRANSPORTADORA):
+        yield CIDADES[rng.randrange(N_CIDADES)].title(), CIDADES[rng.randrange(N_CIDADES)].title()
+
+
+def _detalhes(i):
+    return {
+        "cnpj": f"12.345.{i % 1000:03d}/0001-90", "inscricao_estadual": None, "endereco": f"Rua {i}",
+        "email": f"contato{i}@exemplo.com.br", "telefone": "(11) 99999-8888", "site": None,
+        "whatsapp": None, "imagem": None
+    }
+
+
+def com_dicts(rng):
+    todas = []
+    for inicio in range(0, N_TRANSPORTADORAS, POR_PAGINA):
+        empresas_map = {}
+        for i in range(inicio, inicio + POR_PAGINA):
+            nome = f"Transportadora {i}"
+            empresas_map[nome] = {"nome": nome, "rotas": {"origens": [], "destinos": []}, "detalhes": _detalhes(i)}
+            for origem, destino in _rotas(rng):
+                empresas_map[nome]["rotas"]["origens"].append(origem)
+                empresas_map[nome]["rotas"]["destinos"].append(destino)
+        for emp in empresas_map.values():
+            emp["rotas"]["origens"] = list(set(emp["rotas"]["origens"]))
+            emp["rotas"]["destinos"] = list(set(emp["rotas"]["destinos"]))
+        todas.extend(empresas_map.values())
+    return todas
+
+
+def com_registros(rng):
+    todas = []
+    for inicio in range(0, N_TRANSPORTADORAS, POR_PAGINA):
+        empresas_map = {}
+        for i in range(inicio, inicio + POR_PAGINA):
+            nome = f"Transportadora {i}"
+            transp = empresas_map[nome] = Transportadora(nome, detalhes=Detalhes.de_dict(_detalhes(i)))
+            for origem, destino in _rotas(rng):
+                transp.adicionar_rota(origem, destino)
+        todas.extend(compactar(empresas_map.values()))
+    return todas
+
+
+def medir(funcao):
+    tracemalloc.start()
+    resultado = funcao(random.Random(42))
+    _, pico = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return resultado, pico
+
+
+if __name__ == "__main__":
+    r1, pico_dicts = medir(com_dicts)
+    r2, pico_registros = medir(com_registros)
+    assert [sorted(e["rotas"]["origens"]) for e in r1] == [e["rotas"]["origens"] for e in serializar(r2)]
+
+    print(f"Pico de memória por {N_TRANSPORTADORAS} transportadoras ({ROTAS_POR_TRANSPORTADORA} rotas cada):")
+    print(f"  dicts:     {pico_dicts / 1024 / 1024:.1f} MiB")
+    print(f"  registros: {pico_registros / 1024 / 1024:.1f} MiB ({pico_registros / pico_dicts:.0%})")
@@ -0,0 +1,141 @@
+import contextvars
+import hashlib
+import inspect
+import json
+import marshal
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+ATIVO = os.environ.get("CACHE_DETALHES", "1").lower() in ("1", "true", "sim")
+CACHE_DB = os.environ.get("CACHE_DETALHES_DB", os.path.join("logs", "cache_detalhes.sqlite3"))
+
+# Trechos que mudam a cada requisição sem alterar o conteúdo extraído
+_VOLATEIS = re.compile(
+    r'<!--.*?-->|\snonce="[^"]*"|<meta[^>]+name="csrf-token"[^>]*>|\sdata-csrf="[^"]*"',
+    re.S | re.I
+)
+_ESPACOS = re.compile(r"\s+")
+
+_local = threading.local()
+_versoes = {}
+
+
+# ---------------------------
+# Contadores por execução (herdados pelas threads/tarefas da execução)
+# ---------------------------
+class Contadores:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.analisadas = 0
+        self.reaproveitadas = 0
+
+    def contar(self, reaproveitada):
+        with self.lock:
+            if reaproveitada:
+                self.reaproveitadas += 1
+            else:
+                self.analisadas += 1
+
+    def __str__(self):
+        return f"{self.analisadas} analisadas, {self.reaproveitadas} reaproveitadas"
+
+
+_contadores = contextvars.ContextVar("contadores_detalhes", default=None)
+
+
+@contextmanager
+def contagem():
+    contadores = Contadores()
+    token = _contadores.set(contadores)
+    try:
+        yield contadores
+    finally:
+        _contadores.reset(token)
+
+
+# ---------------------------
+# Impressão digital do HTML normalizado
+# ---------------------------
+def impressao(html):
+    normalizado = _ESPACOS.sub(" ", _VOLATEIS.sub("", html)).strip()
+    return hashlib.blake2b(normalizado.encode("utf-8", "replace"), digest_size=16).hexdigest()
+
+
+def versao_extrator(funcao):
+    # Fonte do módulo inteiro: ajustes em helpers (decode_cfemail, montar_objeto...) e constantes
+    # também invalidam o cache; o nome da função separa extratores do mesmo módulo
+    if funcao not in _versoes:
+        try:
+            dados = inspect.getsource(sys.modules[funcao.__module__]).encode()
+        except (KeyError, OSError, TypeError):
+            dados = marshal.dumps(funcao.__code__)  # módulo sem fonte disponível (ex.: só .pyc)
+        dados += funcao.__qualname__.encode()
+        _versoes[funcao] = hashlib.blake2b(dados, digest_size=8).hexdigest()
+    return _versoes[funcao]
+
+
+# ---------------------------
+# Conexão SQLite por thread
+# ---------------------------
+def _conexao():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        diretorio = os.path.dirname(CACHE_DB)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        conn = sqlite3.connect(CACHE_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS detalhes (
+                url TEXT PRIMARY KEY,
+                impressao TEXT NOT NULL,
+                versao TEXT NOT NULL,
+                registro TEXT NOT NULL,
+                atualizado REAL NOT NULL
+            )
+        """)
+        _local.conn = conn
+    return conn
+
+
+# ---------------------------
+# Reaproveita o registro extraído se a página não mudou
+# ---------------------------
+def reaproveitar(url, html, extrator):
+    contadores = _contadores.get()
+    if not ATIVO or not url:
+        if contadores:
+            contadores.contar(False)
+        return extrator(html)
+
+    digest = impressao(html)
+    versao = versao_extrator(extrator)
+    try:
+        linha = _conexao().execute(
+            "SELECT impressao, versao, registro FROM detalhes WHERE url = ?", (url,)
+        ).fetchone()
+    except sqlite3.Error as e:
+        print(f"⚠️ Cache de detalhes indisponível: {e}")
+        linha = None
+
+    if linha and linha[0] == digest and linha[1] == versao:
+        if contadores:
+            contadores.contar(True)
+        return json.loads(linha[2])
+
+    registro = extrator(html)
+    if contadores:
+        contadores.contar(False)
+    try:
+        _conexao().execute(
+            "INSERT OR REPLACE INTO detalhes (url, impressao, versao, registro, atualizado) VALUES (?, ?, ?, ?, ?)",
+            (url, digest, versao, json.dumps(registro, ensure_ascii=False), time.time())
+        )
+    except sqlite3.Error as e:
+        print(f"⚠️ Falha ao gravar cache de {url}: {e}")
+    return registro
@@ -0,0 +1,216 @@
+import contextvars
+import gzip
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from urllib.parse import urljoin, unquote
+from prazo import Prazo, PrazoEsgotado, buscar
+
+TAMANHO_PAGINA = 50  # transportadoras por página do catálogo
+CACHE_TTL = 6 * 3600  # segundos até redescobrir o catálogo
+PROFUNDIDADE_MAXIMA = 3  # níveis de sitemapindex seguidos
+
+# modulo.__name__ -> Descoberta (links já achados e onde a varredura parou)
+_CACHE = {}
+_LOCKS = {}
+
+
+# ---------------------------
+# Estado da descoberta de um portal, retomável entre chamadas
+# ---------------------------
+class Descoberta:
+    def __init__(self):
+        self.inicio = time.time()
+        self.fonte = None  # "sitemap" | "rotas" | None enquanto os sitemaps não foram lidos
+        self.links = {}  # dict como conjunto ordenado
+        self.proxima_pagina = 1
+        self.total_paginas_rotas = None
+        self.completa = False
+
+
+# ---------------------------
+# Sitemaps candidatos (robots.txt + caminhos usuais)
+# ---------------------------
+def sitemaps_candidatos(modulo, prazo=None):
+    candidatos = list(getattr(modulo, "SITEMAPS", []))
+    try:
+        resp = buscar(urljoin(modulo.BASE, "/robots.txt"), prazo, headers=getattr(modulo, "HEADERS", None))
+        if resp.status_code == 200:
+            for linha in resp.text.splitlines():
+                if linha.lower().startswith("sitemap:"):
+                    candidatos.append(linha.split(":", 1)[1].strip())
+    except PrazoEsgotado:
+        raise
+    except Exception as e:
+        print(f"⚠️ robots.txt indisponível em {modulo.BASE}: {e}")
+    for caminho in ("/sitemap.xml", "/sitemap_index.xml"):
+        candidatos.append(urljoin(modulo.BASE, caminho))
+    return list(dict.fromkeys(candidatos))
+
+
+# ---------------------------
+# Lê um sitemap (ou sitemapindex) e devolve os <loc> de transportadoras
+# ---------------------------
+def ler_sitemap(url, prazo=None, headers=None, profundidade=0, vistos=None):
+    vistos = vistos if vistos is not None else set()
+    if url in vistos or profundidade > PROFUNDIDADE_MAXIMA:
+        return []
+    vistos.add(url)
+
+    resp = buscar(url, prazo, headers=headers)
+    if resp.status_code != 200:
+        return []
+    conteudo = resp.content
+    if url.endswith(".gz") or conteudo[:2] == b"\x1f\x8b":
+        conteudo = gzip.decompress(conteudo)
+    try:
+        raiz = ET.fromstring(conteudo)
+    except ET.ParseError:
+        return []
+
+    locs = [el.text.strip() for el in raiz.iter() if el.tag.endswith("loc") and el.text]
+    if raiz.tag.endswith("sitemapindex"):
+        links = []
+        for filho in locs:
+            links.extend(ler_sitemap(filho, prazo, headers, profundidade + 1, vistos))
+        return links
+    return [loc for loc in locs if "/transportadora/" in loc]
+
+
+# ---------------------------
+# Fallback: percorre as páginas de rotas aos poucos, só até ter `minimo` links
+# ---------------------------
+def links_por_rotas(modulo, estado, prazo=None, minimo=None):
+    headers = getattr(modulo, "HEADERS", None)
+    if estado.total_paginas_rotas is None:
+        total = modulo.get_total_paginas(prazo)
+        if not total:
+            return  # listagem indisponível; tenta de novo na próxima chamada
+        estado.total_paginas_rotas = total
+
+    while estado.proxima_pagina <= estado.total_paginas_rotas:
+        if minimo is not None and len(estado.links) >= minimo:
+            return
+        links = []
+        resp = buscar(modulo.url_rotas(estado.proxima_pagina), prazo, headers=headers)
+        for rota in modulo.parse_rotas(resp.text if resp.status_code == 200 else None):
+            resp_rota = buscar(rota.link, prazo, headers=headers)
+            html = resp_rota.text if resp_rota.status_code == 200 else None
+            links.extend(emp["link_transportadora"] for emp in modulo.parse_transportadoras(html, rota))
+        # Só avança depois da página inteira: um prazo esgotado no meio repete a página
+        estado.links.update(dict.fromkeys(links))
+        estado.proxima_pagina += 1
+    estado.completa = True
+
+
+def links_por_sitemap(modulo, prazo=None):
+    headers = getattr(modulo, "HEADERS", None)
+    vistos = set()
+    links = []
+    for url in sitemaps_candidatos(modulo, prazo):
+        try:
+            links.extend(ler_sitemap(url, prazo, headers, vistos=vistos))
+        except PrazoEsgotado:
+            raise
+        except Exception as e:
+            print(f"⚠️ Erro lendo sitemap {url}: {e}")
+    return links
+
+
+# ---------------------------
+# Descobre as URLs /transportadora/ de um portal
+# Retorna (fonte, links, completa); com `minimo`, a varredura de rotas para ao atingi-lo
+# ---------------------------
+def descobrir_transportadoras(modulo, prazo=None, renovar=False, minimo=None):
+    prazo = prazo or Prazo()
+    lock = _LOCKS.setdefault(modulo.__name__, threading.Lock())
+    restante = prazo.restante()
+    if not lock.acquire(timeout=-1 if restante is None else max(restante, 0)):
+        # Outra requisição está varrendo o portal: responde com o que já se sabe
+        estado = _CACHE.get(modulo.__name__) or Descoberta()
+        return estado.fonte, list(estado.links), estado.completa
+
+    try:
+        estado = _CACHE.get(modulo.__name__)
+        if estado is None or renovar or time.time() - estado.inicio >= CACHE_TTL:
+            estado = _CACHE[modulo.__name__] = Descoberta()
+        try:
+            if estado.fonte is None:
+                links = links_por_sitemap(modulo, prazo)
+                if links:
+                    estado.fonte = "sitemap"
+                    estado.links = dict.fromkeys(links)
+                    estado.completa = True
+                else:
+                    print(f"🔁 Sem sitemap de transportadoras em {modulo.BASE}, percorrendo rotas...")
+                    estado.fonte = "rotas"
+            if not estado.completa:
+                links_por_rotas(modulo, estado, prazo, minimo)
+        except PrazoEsgotado:
+            pass  # o progresso fica no estado; a próxima chamada continua de onde parou
+        return estado.fonte, list(estado.links), estado.completa
+    finally:
+        lock.release()
+
+
+# ---------------------------
+# Nome provisório a partir do slug da URL
+# ---------------------------
+def nome_do_link(link):
+    slug = unquote(link.rstrip("/").split("/transportadora/")[-1].split("/")[0])
+    return slug.replace("-", " ").title()
+
+
+# ---------------------------
+# Executa uma página do catálogo (só páginas de detalhe)
+# ---------------------------
+def executar_pagina(modulo, pagina_num, prazo=None, tamanho=TAMANHO_PAGINA, renovar=False):
+    prazo = prazo or Prazo()
+    inicio = (pagina_num - 1) * tamanho
+    fonte, links, completa = descobrir_transportadoras(modulo, prazo, renovar, minimo=inicio + tamanho)
+
+    lote = links[inicio:inicio + tamanho]
+    headers = getattr(modulo, "HEADERS", None)
+
+    def detalhe(link):
+        emp = {
+            "nome": nome_do_link(link),
+            "origem": None, "destino": None,
+            "rota_origem": None, "rota_destino": None,
+            "link_transportadora": link
+        }
+        resp = buscar(link, prazo, headers=headers)
+        return emp, modulo.parse_detalhes(resp.text if resp.status_code == 200 else None, emp)
+
+    resultados = {}
+    falhas = set()
+    with ThreadPoolExecutor(max_workers=getattr(modulo, "MAX_WORKERS", 8)) as executor:
+        futures = {executor.submit(contextvars.copy_context().run, detalhe, link): link for link in lote}
+        try:
+            for future in as_completed(futures, timeout=prazo.restante()):
+                try:
+                    resultados[futures[future]] = future.result()
+                except PrazoEsgotado:
+                    continue
+                except Exception as e:
+                    falhas.add(futures[future])
+                    print(f"⚠️ Erro em {futures[future]}: {e}")
+        except FuturesTimeout:
+            pass
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    itens = [resultados[link] for link in lote if link in resultados]
+    pendentes = [link for link in lote if link not in resultados and link not in falhas]
+    # Com a descoberta incompleta, os totais são o mínimo conhecido até agora
+    return {
+        "fonte": fonte or "indefinida",
+        "pagina": pagina_num,
+        "total_paginas": -(-len(links) // tamanho),
+        "total_transportadoras": len(links),
+        "descoberta_completa": completa,
+        "parcial": bool(pendentes) or (not completa and len(lote) < tamanho),
+        "links_pendentes": pendentes,
+        "transportadoras": modulo.agregar(itens)
+    }
+
@@ -0,0 +1,148 @@
+import argparse
+import csv
+import io
+import json
+import sys
+from dataclasses import fields
+from itertools import islice
+import versoes
+from registros import Detalhes
+
+# pyarrow está em requirements.txt; a guarda só cobre ambientes de desenvolvimento sem ele
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+FORMATOS = ("csv", "ndjson", "parquet")
+TAMANHO_LOTE = 5000  # linhas por lote (e por row group no parquet)
+CAMPOS_DETALHES = [f.name for f in fields(Detalhes) if f.name not in ("campos", "extras")]
+COLUNAS = ["modulo", "origem_dados", "pagina", "coleta_id", "nome", "tipo_rota", "cidade"] + CAMPOS_DETALHES
+
+
+# ---------------------------
+# Linhas achatadas: uma por transportadora × cidade de rota
+# ---------------------------
+def linhas(modulo=None):
+    for escopo, nome, coleta_id, registro in versoes.iterar_estado(modulo):
+        partes = escopo.split(":")
+        base = {
+            "modulo": partes[0],
+            "origem_dados": "catalogo" if len(partes) == 3 else "rotas",
+            "pagina": partes[-1],
+            "coleta_id": coleta_id,
+            "nome": nome
+        }
+        detalhes = registro.get("detalhes") or {}
+        base.update({campo: detalhes.get(campo) for campo in CAMPOS_DETALHES})
+
+        rotas = registro.get("rotas") or {}
+        cidades = [("origem", c) for c in rotas.get("origens", [])] + [("destino", c) for c in rotas.get("destinos", [])]
+        if not cidades:
+            cidades = [(None, None)]  # transportadora sem rotas (ex.: catálogo) ainda gera uma linha
+        for tipo_rota, cidade in cidades:
+            yield {**base, "tipo_rota": tipo_rota, "cidade": cidade}
+
+
+def em_lotes(iteravel, tamanho=TAMANHO_LOTE):
+    iterador = iter(iteravel)
+    while True:
+        lote = list(islice(iterador, tamanho))
+        if not lote:
+            return
+        yield lote
+
+
+# ---------------------------
+# Formatos (cada um gera pedaços de bytes, lote a lote)
+# ---------------------------
+def gerar_csv(lotes):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=COLUNAS)
+    escritor.writeheader()
+    for lote in lotes:
+        escritor.writerows(lote)
+        yield buffer.getvalue().encode("utf-8")
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue().encode("utf-8")
+
+
+def gerar_ndjson(lotes):
+    for lote in lotes:
+        yield "".join(json.dumps(linha, ensure_ascii=False) + "\n" for linha in lote).encode("utf-8")
+
+
+class _Pedacos:
+    # Destino de escrita que acumula os bytes do parquet até serem repassados
+    def __init__(self):
+        self.pedacos = []
+        self.posicao = 0
+        self.closed = False
+
+    def write(self, dados):
+        self.pedacos.append(bytes(dados))
+        self.posicao += len(dados)
+        return len(dados)
+
+    def tell(self):
+        return self.posicao
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drenar(self):
+        dados = b"".join(self.pedacos)
+        self.pedacos = []
+        return dados
+
+
+def esquema_parquet():
+    return pyarrow.schema([
+        (coluna, pyarrow.int64() if coluna == "coleta_id" else pyarrow.string()) for coluna in COLUNAS
+    ])
+
+
+def gerar_parquet(lotes):
+    if pyarrow is None:
+        raise RuntimeError("Exportação em parquet requer o pacote pyarrow")
+    destino = _Pedacos()
+    esquema = esquema_parquet()
+    with pyarrow.parquet.ParquetWriter(destino, esquema, compression="zstd") as escritor:
+        for lote in lotes:
+            escritor.write_table(pyarrow.Table.from_pylist(lote, schema=esquema))
+            yield destino.drenar()
+    yield destino.drenar()
+
+
+GERADORES = {"csv": gerar_csv, "ndjson": gerar_ndjson, "parquet": gerar_parquet}
+TIPOS = {"csv": "text/csv", "ndjson": "application/x-ndjson", "parquet": "application/vnd.apache.parquet"}
+
+
+def exportar(formato, modulo=None, tamanho_lote=TAMANHO_LOTE):
+    return GERADORES[formato](em_lotes(linhas(modulo), tamanho_lote))
+
+
+# ---------------------------
+# CLI: python exportar.py --formato parquet --saida transportadoras.parquet
+# ---------------------------
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta as transportadoras acumuladas nas coletas")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--modulo", default=None, help="Só um scraper (app, app2, app3)")
+    parser.add_argument("--lote", type=int, default=TAMANHO_LOTE, help="Linhas por lote")
+    parser.add_argument("--saida", default="-", help="Arquivo de saída (padrão: stdout)")
+    args = parser.parse_args()
+
+    saida = sys.stdout.buffer if args.saida == "-" else open(args.saida, "wb")
+    try:
+        for pedaco in exportar(args.formato, args.modulo, args.lote):
+            saida.write(pedaco)
+    finally:
+        if saida is not sys.stdout.buffer:
+            saida.close()
@@ -0,0 +1,358 @@
+import importlib
+import json
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+from urllib.parse import urlparse
+import prazo
+from prazo import Prazo, PrazoEsgotado, buscar, resultado_parcial
+
+FILA_BACKEND = os.environ.get("FILA_BACKEND", "sqlite")
+FILA_DB = os.environ.get("FILA_DB", os.path.join("logs", "fila.sqlite3"))
+TRABALHADORES = int(os.environ.get("TRABALHADORES", 1))  # threads de trabalho por réplica
+DURACAO_LEASE = 60  # segundos sem heartbeat até a unidade voltar para a fila
+INTERVALO_OCIOSO = 2  # segundos entre consultas quando a fila está vazia
+MAX_TENTATIVAS = 3
+# Intervalo mínimo global por host, compartilhado por todos os processos que usam o mesmo FILA_DB.
+# Desligado por padrão (0): com N ms, cada host recebe no máximo 1000/N req/s somando todas as
+# réplicas (200 ms = 5 req/s), e cada busca paga uma transação BEGIN IMMEDIATE no SQLite
+INTERVALO_HOST_MS = int(os.environ.get("INTERVALO_HOST_MS", 0))
+
+
+# ---------------------------
+# Backend SQLite (arquivo no volume compartilhado entre réplicas)
+# ---------------------------
+class FilaSQLite:
+    def __init__(self, caminho=FILA_DB):
+        self.caminho = caminho
+        self._local = threading.local()
+        self._conexao()
+
+    def _conexao(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            diretorio = os.path.dirname(self.caminho)
+            if diretorio:
+                os.makedirs(diretorio, exist_ok=True)
+            conn = sqlite3.connect(self.caminho, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS rodadas (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    modulo TEXT NOT NULL,
+                    inicio INTEGER NOT NULL,
+                    fim INTEGER NOT NULL,
+                    criada REAL NOT NULL
+                );
+                CREATE TABLE IF NOT EXISTS unidades (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    rodada_id INTEGER NOT NULL,
+                    tipo TEXT NOT NULL,
+                    chave TEXT NOT NULL,
+                    payload TEXT NOT NULL,
+                    status TEXT NOT NULL DEFAULT 'pendente',
+                    dono TEXT,
+                    expira REAL,
+                    tentativas INTEGER NOT NULL DEFAULT 0,
+                    resultado TEXT,
+                    erro TEXT,
+                    coleta_id INTEGER,
+                    UNIQUE (rodada_id, tipo, chave)
+                );
+                CREATE INDEX IF NOT EXISTS idx_unidades_status ON unidades (status, expira);
+                CREATE TABLE IF NOT EXISTS hosts (
+                    host TEXT PRIMARY KEY,
+                    proximo REAL NOT NULL
+                );
+            """)
+            colunas = [linha[1] for linha in conn.execute("PRAGMA table_info(unidades)")]
+            if "coleta_id" not in colunas:
+                conn.execute("ALTER TABLE unidades ADD COLUMN coleta_id INTEGER")
+            self._local.conn = conn
+        return conn
+
+    def _transacao(self, funcao):
+        conn = self._conexao()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            resultado = funcao(conn)
+            conn.execute("COMMIT")
+            return resultado
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def criar_rodada(self, modulo, inicio, fim):
+        def criar(conn):
+            rodada_id = conn.execute(
+                "INSERT INTO rodadas (modulo, inicio, fim, criada) VALUES (?, ?, ?, ?)",
+                (modulo, inicio, fim, time.time())
+            ).lastrowid
+            for pagina in range(inicio, fim + 1):
+                conn.execute(
+                    "INSERT OR IGNORE INTO unidades (rodada_id, tipo, chave, payload) VALUES (?, 'pagina', ?, ?)",
+                    (rodada_id, str(pagina), json.dumps({"modulo": modulo, "pagina": pagina}))
+                )
+            return rodada_id
+        return self._transacao(criar)
+
+    def rodada(self, rodada_id):
+        linha = self._conexao().execute(
+            "SELECT id, modulo, inicio, fim, criada FROM rodadas WHERE id = ?", (rodada_id,)
+        ).fetchone()
+        if linha is None:
+            return None
+        return dict(zip(("id", "modulo", "inicio", "fim", "criada"), linha))
+
+    def enfileirar(self, rodada_id, tipo, chave, payload):
+        self._conexao().execute(
+            "INSERT OR IGNORE INTO unidades (rodada_id, tipo, chave, payload) VALUES (?, ?, ?, ?)",
+            (rodada_id, tipo, chave, json.dumps(payload, ensure_ascii=False))
+        )
+
+    def arrendar(self, dono, duracao=DURACAO_LEASE):
+        def arrendar(conn):
+            agora = time.time()
+            # Lease vencido de novo na última tentativa: a unidade derruba quem a pega (OOM, travamento)
+            conn.execute("""
+                UPDATE unidades SET status = 'erro', erro = 'lease expirado', dono = NULL, expira = NULL
+                WHERE status = 'arrendada' AND expira < ? AND tentativas >= ?
+            """, (agora, MAX_TENTATIVAS))
+            linha = conn.execute("""
+                SELECT id, rodada_id, tipo, chave, payload FROM unidades
+                WHERE status = 'pendente' OR (status = 'arrendada' AND expira < ?)
+                ORDER BY tipo = 'pagina', id
+                LIMIT 1
+            """, (agora,)).fetchone()
+            if linha is None:
+                return None
+            conn.execute(
+                "UPDATE unidades SET status = 'arrendada', dono = ?, expira = ?, tentativas = tentativas + 1 WHERE id = ?",
+                (dono, agora + duracao, linha[0])
+            )
+            unidade = dict(zip(("id", "rodada_id", "tipo", "chave", "payload"), linha))
+            unidade["payload"] = json.loads(unidade["payload"])
+            return unidade
+        return self._transacao(arrendar)
+
+    def renovar(self, unidade_id, dono, duracao=DURACAO_LEASE):
+        cursor = self._conexao().execute(
+            "UPDATE unidades SET expira = ? WHERE id = ? AND dono = ? AND status = 'arrendada'",
+            (time.time() + duracao, unidade_id, dono)
+        )
+        return cursor.rowcount == 1
+
+    def concluir(self, unidade_id, resultado):
+        # Primeira conclusão vence: réplicas que terminem a mesma unidade depois não sobrescrevem
+        self._conexao().execute(
+            "UPDATE unidades SET status = 'concluida', resultado = ?, expira = NULL WHERE id = ? AND status != 'concluida'",
+            (json.dumps(resultado, ensure_ascii=False), unidade_id)
+        )
+
+    def falhar(self, unidade_id, dono, erro):
+        self._conexao().execute("""
+            UPDATE unidades
+            SET status = CASE WHEN tentativas >= ? THEN 'erro' ELSE 'pendente' END, erro = ?, dono = NULL, expira = NULL
+            WHERE id = ? AND dono = ? AND status = 'arrendada'
+        """, (MAX_TENTATIVAS, erro, unidade_id, dono))
+
+    def unidades(self, rodada_id, tipo):
+        linhas = self._conexao().execute(
+            "SELECT chave, status, resultado FROM unidades WHERE rodada_id = ? AND tipo = ?", (rodada_id, tipo)
+        ).fetchall()
+        return {chave: (status, json.loads(resultado) if resultado else None) for chave, status, resultado in linhas}
+
+    def resumo(self, rodada_id):
+        linhas = self._conexao().execute(
+            "SELECT tipo, status, COUNT(*) FROM unidades WHERE rodada_id = ? GROUP BY tipo, status", (rodada_id,)
+        ).fetchall()
+        resumo = {}
+        for tipo, status, total in linhas:
+            resumo.setdefault(tipo, {})[status] = total
+        return resumo
+
+    def coleta_da_pagina(self, rodada_id, pagina):
+        linha = self._conexao().execute(
+            "SELECT coleta_id FROM unidades WHERE rodada_id = ? AND tipo = 'pagina' AND chave = ?",
+            (rodada_id, str(pagina))
+        ).fetchone()
+        return linha[0] if linha else None
+
+    def marcar_coleta(self, rodada_id, pagina, coleta_id):
+        self._conexao().execute(
+            "UPDATE unidades SET coleta_id = ? WHERE rodada_id = ? AND tipo = 'pagina' AND chave = ? AND coleta_id IS NULL",
+            (coleta_id, rodada_id, str(pagina))
+        )
+
+    def reservar_slot(self, host, intervalo, espera_maxima=None):
+        # Slot além de espera_maxima não é gravado (retorna None): quem desiste não empurra o host
+        def reservar(conn):
+            agora = time.time()
+            linha = conn.execute("SELECT proximo FROM hosts WHERE host = ?", (host,)).fetchone()
+            slot = max(agora, linha[0]) if linha else agora
+            if espera_maxima is not None and slot - agora > espera_maxima:
+                return None
+            conn.execute("INSERT OR REPLACE INTO hosts (host, proximo) VALUES (?, ?)", (host, slot + intervalo))
+            return slot
+        return self._transacao(reservar)
+
+
+BACKENDS = {"sqlite": FilaSQLite}
+_fila = None
+_fila_lock = threading.Lock()
+
+
+def abrir_fila():
+    global _fila
+    with _fila_lock:
+        if _fila is None:
+            _fila = BACKENDS[FILA_BACKEND]()
+        return _fila
+
+
+# ---------------------------
+# Limite de taxa por host, global entre réplicas
+# ---------------------------
+class LimitadorGlobal:
+    def __init__(self, fila, intervalo_ms=INTERVALO_HOST_MS):
+        self.fila = fila
+        self.intervalo = intervalo_ms / 1000.0
+
+    def reservar(self, url, prazo_execucao=None):
+        # Segundos até a vez desta requisição no host; sem vez dentro do prazo, nada é reservado
+        restante = prazo_execucao.restante() if prazo_execucao else None
+        slot = self.fila.reservar_slot(urlparse(url).netloc, self.intervalo, restante)
+        if slot is None:
+            raise PrazoEsgotado(url)
+        return slot - time.time()
+
+    def aguardar(self, url, prazo_execucao=None):
+        espera = self.reservar(url, prazo_execucao)
+        if espera > 0:
+            (prazo_execucao or Prazo()).dormir(espera)
+
+
+def ativar_limitador():
+    # Chamado na inicialização da API e do trabalhador: vale para toda busca do processo se INTERVALO_HOST_MS > 0
+    if INTERVALO_HOST_MS > 0:
+        prazo.limitador = LimitadorGlobal(abrir_fila())
+
+
+# ---------------------------
+# Processamento das unidades
+# ---------------------------
+def processar_pagina(fila, unidade):
+    modulo = importlib.import_module(unidade["payload"]["modulo"])
+    headers = getattr(modulo, "HEADERS", None)
+
+    resp = buscar(modulo.url_rotas(unidade["payload"]["pagina"]), headers=headers)
+    rotas = modulo.parse_rotas(resp.text if resp.status_code == 200 else None)
+    empresas = []
+    for rota in rotas:
+        resp = buscar(rota.link, headers=headers)
+        empresas.extend(modulo.parse_transportadoras(resp.text if resp.status_code == 200 else None, rota))
+
+    # Reenfileirar é idempotente se a unidade da página for refeita após expirar
+    for emp in empresas:
+        chave = emp["link_transportadora"]
+        fila.enfileirar(unidade["rodada_id"], "transportadora", chave, {"modulo": modulo.__name__, "emp": emp})
+    return {"rotas": len(rotas), "empresas": empresas}
+
+
+def processar_transportadora(fila, unidade):
+    modulo = importlib.import_module(unidade["payload"]["modulo"])
+    emp = unidade["payload"]["emp"]
+    resp = buscar(emp["link_transportadora"], headers=getattr(modulo, "HEADERS", None))
+    return modulo.parse_detalhes(resp.text if resp.status_code == 200 else None, emp)
+
+
+PROCESSADORES = {"pagina": processar_pagina, "transportadora": processar_transportadora}
+
+
+class Trabalhador(threading.Thread):
+    def __init__(self, fila, numero=0):
+        super().__init__(daemon=True, name=f"trabalhador-{numero}")
+        self.fila = fila
+        self.dono = f"{socket.gethostname()}-{os.getpid()}-{numero}"
+        self.parar = threading.Event()
+
+    def _batimentos(self, unidade_id, fim):
+        while not fim.wait(DURACAO_LEASE / 3):
+            if not self.fila.renovar(unidade_id, self.dono):
+                print(f"⚠️ Lease da unidade {unidade_id} perdido por {self.dono}")
+                return
+
+    def run(self):
+        while not self.parar.is_set():
+            try:
+                unidade = self.fila.arrendar(self.dono)
+            except sqlite3.Error as e:
+                print(f"⚠️ Fila indisponível: {e}")
+                unidade = None
+            if unidade is None:
+                self.parar.wait(INTERVALO_OCIOSO)
+                continue
+
+            fim = threading.Event()
+            threading.Thread(target=self._batimentos, args=(unidade["id"], fim), daemon=True).start()
+            try:
+                resultado = PROCESSADORES[unidade["tipo"]](self.fila, unidade)
+                self.fila.concluir(unidade["id"], resultado)
+            except Exception as e:
+                traceback.print_exc()
+                self.fila.falhar(unidade["id"], self.dono, str(e))
+            finally:
+                fim.set()
+
+
+def iniciar_trabalhadores(quantidade=TRABALHADORES):
+    fila = abrir_fila()
+    trabalhadores = [Trabalhador(fila, i) for i in range(quantidade)]
+    for trabalhador in trabalhadores:
+        trabalhador.start()
+    print(f"👷 {quantidade} trabalhador(es) da fila iniciados ({FILA_BACKEND}: {FILA_DB})")
+    return trabalhadores
+
+
+# ---------------------------
+# Junta os resultados de uma página da rodada
+# ---------------------------
+def resultado_pagina(fila, rodada_id, pagina):
+    rodada = fila.rodada(rodada_id)
+    modulo = importlib.import_module(rodada["modulo"])
+    status, dados = fila.unidades(rodada_id, "pagina").get(str(pagina), (None, None))
+    if status != "concluida":
+        return resultado_parcial([], [], modulo.url_rotas(pagina))
+    if not dados["rotas"]:
+        mensagem = getattr(modulo, "MENSAGEM_SEM_ROTAS", None)
+        return {"mensagem": mensagem.format(pagina=pagina)} if mensagem else []
+
+    detalhes = fila.unidades(rodada_id, "transportadora")
+    itens = []
+    pendentes = []
+    for emp in dados["empresas"]:
+        status, registro = detalhes.get(emp["link_transportadora"], (None, None))
+        if status == "concluida":
+            itens.append((emp, registro))
+        elif status != "erro" and emp["link_transportadora"] not in pendentes:
+            pendentes.append(emp["link_transportadora"])
+
+    if pendentes:
+        return {"parcial": True, "transportadoras": modulo.agregar(itens), "links_pendentes": pendentes}
+    return modulo.agregar(itens)
+
+
+# ---------------------------
+# CLI: réplica só de trabalho (sem API)
+# ---------------------------
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != "trabalhar":
+        print("Uso: python fila.py trabalhar")
+        sys.exit(1)
+    ativar_limitador()
+    for trabalhador in iniciar_trabalhadores():
+        trabalhador.join()
@@ -0,0 +1,131 @@
+import asyncio
+import contextvars
+import os
+from concurrent.futures import ThreadPoolExecutor
+import aiohttp
+import arquivo
+import prazo as controle_prazo
+from prazo import Prazo, PrazoEsgotado, TIMEOUT_PADRAO, resultado_parcial
+
+# Número máximo de requisições simultâneas no event loop
+CONCORRENCIA = int(os.environ.get("CONCORRENCIA_ASYNC", 200))
+# Threads para o trabalho bloqueante (BeautifulSoup, cache SQLite, arquivo de HTML)
+THREADS_PROCESSAMENTO = int(os.environ.get("THREADS_PROCESSAMENTO_ASYNC", 8))
+
+
+# ---------------------------
+# Roda trabalho bloqueante fora do event loop, herdando os contadores da execução
+# ---------------------------
+async def em_thread(executor, funcao, *args):
+    contexto = contextvars.copy_context()
+    return await asyncio.get_running_loop().run_in_executor(executor, contexto.run, funcao, *args)
+
+
+# ---------------------------
+# GET assíncrono respeitando o prazo
+# ---------------------------
+async def aguardar_vez(url, prazo):
+    # Mesmo limite global por host do caminho síncrono; a reserva no SQLite roda fora do event loop.
+    # Só reserva quem já tem vaga no semáforo, e nunca além do prazo (PrazoEsgotado sem gravar o slot)
+    limitador = controle_prazo.limitador
+    if limitador is None:
+        return
+    espera = await asyncio.to_thread(limitador.reservar, url, prazo)
+    if espera > 0:
+        await asyncio.sleep(espera)
+
+
+async def buscar(sessao, url, prazo, limite, headers=None, executor=None):
+    async with limite:
+        await aguardar_vez(url, prazo)
+        timeout = aiohttp.ClientTimeout(total=prazo.timeout(TIMEOUT_PADRAO))
+        try:
+            async with sessao.get(url, headers=headers, timeout=timeout) as resp:
+                if resp.status != 200:
+                    return None
+                conteudo = await resp.read()
+                encoding = resp.get_encoding()
+                if arquivo.ARQUIVAR:
+                    await em_thread(executor, arquivo.arquivar, url, conteudo, encoding)
+                return conteudo.decode(encoding, errors="replace")
+        except asyncio.TimeoutError:
+            if prazo.esgotado():
+                raise PrazoEsgotado(url)
+            return None
+        except aiohttp.ClientError as e:
+            print(f"⚠️ Erro em {url}: {e}")
+            return None
+
+
+# ---------------------------
+# Pipeline de uma página: rotas → transportadoras → detalhes
+# Usa os ganchos de cada módulo (url_rotas, parse_rotas,
+# parse_transportadoras, parse_detalhes, agregar)
+# ---------------------------
+async def _executar(modulo, pagina_num, prazo):
+    headers = getattr(modulo, "HEADERS", None)
+    limite = asyncio.Semaphore(CONCORRENCIA)
+    conector = aiohttp.TCPConnector(limit=CONCORRENCIA)
+    executor = ThreadPoolExecutor(max_workers=THREADS_PROCESSAMENTO)
+
+    try:
+        return await _pipeline(modulo, pagina_num, prazo, headers, limite, conector, executor)
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def _pipeline(modulo, pagina_num, prazo, headers, limite, conector, executor):
+    async with aiohttp.ClientSession(connector=conector) as sessao:
+        try:
+            html = await buscar(sessao, modulo.url_rotas(pagina_num), prazo, limite, headers, executor)
+        except PrazoEsgotado:
+            return resultado_parcial([], [], modulo.url_rotas(pagina_num))
+        rotas = await em_thread(executor, modulo.parse_rotas, html)
+        if not rotas:
+            mensagem = getattr(modulo, "MENSAGEM_SEM_ROTAS", None)
+            return {"mensagem": mensagem.format(pagina=pagina_num)} if mensagem else []
+
+        # Cada transportadora é baixada uma única vez, mesmo que apareça em várias rotas
+        detalhes_por_link = {}
+        itens_por_rota = [[] for _ in rotas]
+
+        async def detalhe(emp):
+            html = await buscar(sessao, emp["link_transportadora"], prazo, limite, headers, executor)
+            return await em_thread(executor, modulo.parse_detalhes, html, emp)
+
+        async def processar_rota(i, rota):
+            html = await buscar(sessao, rota.link, prazo, limite, headers, executor)
+            empresas = await em_thread(executor, modulo.parse_transportadoras, html, rota)
+            tarefas = []
+            for emp in empresas:
+                link = emp["link_transportadora"]
+                if link not in detalhes_por_link:
+                    detalhes_por_link[link] = asyncio.ensure_future(detalhe(emp))
+                tarefas.append(detalhes_por_link[link])
+            for emp, tarefa in zip(empresas, tarefas):
+                itens_por_rota[i].append((emp, await tarefa))
+
+        tarefas_rotas = [asyncio.ensure_future(processar_rota(i, rota)) for i, rota in enumerate(rotas)]
+        _, pendentes = await asyncio.wait(tarefas_rotas, timeout=prazo.restante())
+        for tarefa in list(pendentes) + list(detalhes_por_link.values()):
+            tarefa.cancel()
+        await asyncio.gather(*tarefas_rotas, *detalhes_por_link.values(), return_exceptions=True)
+
+    rotas_pendentes = []
+    for rota, tarefa in zip(rotas, tarefas_rotas):
+        if tarefa.cancelled() or isinstance(tarefa.exception(), PrazoEsgotado):
+            rotas_pendentes.append(rota)
+        elif tarefa.exception() is not None:
+            raise tarefa.exception()
+
+    itens = [item for itens_rota in itens_por_rota for item in itens_rota]
+    if rotas_pendentes:
+        return resultado_parcial(modulo.agregar(itens), rotas_pendentes)
+    return modulo.agregar(itens)
+
+
+# ---------------------------
+# Mesmo contrato de modulo.executar_pagina
+# ---------------------------
+def executar_pagina(modulo, pagina_num, prazo=None):
+    return asyncio.run(_executar(modulo, pagina_num, prazo or Prazo()))
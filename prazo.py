@@ -0,0 +1,78 @@
+import time
+import requests
+from arquivo import arquivar
+
+TIMEOUT_PADRAO = 15  # segundos por requisição quando não há prazo menor
+
+# Limite de taxa por host compartilhado entre réplicas (definido por fila.iniciar_trabalhadores)
+limitador = None
+
+
+class PrazoEsgotado(Exception):
+    pass
+
+
+# ---------------------------
+# Prazo (deadline) de uma execução
+# ---------------------------
+class Prazo:
+    def __init__(self, deadline_ms=None):
+        self.limite = None
+        if deadline_ms is not None:
+            self.limite = time.monotonic() + deadline_ms / 1000.0
+
+    def restante(self):
+        if self.limite is None:
+            return None
+        return self.limite - time.monotonic()
+
+    def esgotado(self):
+        restante = self.restante()
+        return restante is not None and restante <= 0
+
+    def timeout(self, padrao=TIMEOUT_PADRAO):
+        restante = self.restante()
+        if restante is None:
+            return padrao
+        if restante <= 0:
+            raise PrazoEsgotado()
+        return min(padrao, restante)
+
+    def dormir(self, segundos):
+        restante = self.restante()
+        if restante is not None:
+            segundos = min(segundos, max(restante, 0))
+        time.sleep(segundos)
+
+
+# ---------------------------
+# GET respeitando o prazo
+# ---------------------------
+def buscar(url, prazo=None, cliente=requests, timeout=TIMEOUT_PADRAO, **kwargs):
+    prazo = prazo or Prazo()
+    if limitador is not None:
+        limitador.aguardar(url, prazo)
+    try:
+        resp = cliente.get(url, timeout=prazo.timeout(timeout), **kwargs)
+    except requests.exceptions.Timeout:
+        if prazo.esgotado():
+            raise PrazoEsgotado(url)
+        raise
+    if resp.status_code == 200:
+        arquivar(url, resp.content, resp.encoding)
+    return resp
+
+
+# ---------------------------
+# Resultado parcial quando o prazo acaba
+# ---------------------------
+def resultado_parcial(transportadoras, rotas_pendentes, listagem_pendente=None):
+    resultado = {
+        "parcial": True,
+        "transportadoras": transportadoras,
+        "rotas_pendentes": rotas_pendentes
+    }
+    if listagem_pendente:
+        # O prazo acabou antes de a própria listagem de rotas ser lida
+        resultado["listagem_pendente"] = listagem_pendente
+    return resultado
@@ -0,0 +1,118 @@
+import sys
+from dataclasses import dataclass, field, fields
+
+# Tuplas de campos compartilhadas entre registros com o mesmo formato
+_CAMPOS = {}
+
+
+def cidade(nome):
+    return sys.intern(nome) if nome else None
+
+
+# ---------------------------
+# Rota (origem → destino)
+# ---------------------------
+@dataclass(frozen=True, slots=True)
+class Rota:
+    origem: str = None
+    destino: str = None
+    link: str = None
+
+    @classmethod
+    def nova(cls, origem, destino, link=None):
+        return cls(cidade(origem), cidade(destino), link)
+
+    def para_dict(self):
+        return {"origem": self.origem, "destino": self.destino, "link": self.link}
+
+
+# ---------------------------
+# Detalhes de contato da transportadora
+# ---------------------------
+@dataclass(slots=True)
+class Detalhes:
+    campos: tuple = ()
+    telefone: str = None
+    whatsapp: str = None
+    site: str = None
+    email: str = None
+    endereco: str = None
+    cnpj: str = None
+    inscricao_estadual: str = None
+    imagem: str = None
+    instagram: str = None
+    facebook: str = None
+    horario_funcionamento: str = None
+    antt: str = None
+    extras: dict = None  # campos novos dos extratores ainda sem slot próprio
+
+    @classmethod
+    def de_dict(cls, dados):
+        chaves = tuple(dados)
+        campos = _CAMPOS.setdefault(chaves, chaves)
+        conhecidos = {chave: valor for chave, valor in dados.items() if chave in _CAMPOS_DETALHES}
+        extras = {chave: valor for chave, valor in dados.items() if chave not in _CAMPOS_DETALHES}
+        return cls(campos, **conhecidos, extras=extras or None)
+
+    def __bool__(self):
+        return bool(self.campos)
+
+    def para_dict(self):
+        return {
+            campo: getattr(self, campo) if campo in _CAMPOS_DETALHES else self.extras[campo]
+            for campo in self.campos
+        }
+
+
+_CAMPOS_DETALHES = frozenset(f.name for f in fields(Detalhes)) - {"campos", "extras"}
+
+
+# ---------------------------
+# Transportadora com rotas acumuladas em conjuntos
+# (compactadas em tuplas ordenadas ao fim de cada página)
+# ---------------------------
+@dataclass(slots=True)
+class Transportadora:
+    nome: str
+    origens: set = field(default_factory=set)
+    destinos: set = field(default_factory=set)
+    detalhes: Detalhes = None
+
+    def adicionar_rota(self, origem=None, destino=None):
+        if origem:
+            if isinstance(self.origens, tuple):
+                self.origens = set(self.origens)
+            self.origens.add(cidade(origem))
+        if destino:
+            if isinstance(self.destinos, tuple):
+                self.destinos = set(self.destinos)
+            self.destinos.add(cidade(destino))
+
+    def compactar(self):
+        self.origens = tuple(sorted(self.origens))
+        self.destinos = tuple(sorted(self.destinos))
+        return self
+
+    def para_dict(self):
+        return {
+            "nome": self.nome,
+            "rotas": {"origens": sorted(self.origens), "destinos": sorted(self.destinos)},
+            "detalhes": self.detalhes.para_dict() if self.detalhes else {}
+        }
+
+
+def compactar(transportadoras):
+    return [t.compactar() for t in transportadoras]
+
+
+# ---------------------------
+# Serialização na borda (API / exportação)
+# ---------------------------
+def serializar(obj):
+    if isinstance(obj, (Transportadora, Detalhes, Rota)):
+        return obj.para_dict()
+    if isinstance(obj, dict):
+        return {k: serializar(v) for k, v in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [serializar(v) for v in obj]
+    return obj
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import math
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+VERSOES_DB = os.environ.get("VERSOES_DB", os.path.join("logs", "versoes.sqlite3"))
+
+_local = threading.local()
+
+
+# ---------------------------
+# Conexão SQLite por thread
+# ---------------------------
+def _conexao():
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        diretorio = os.path.dirname(VERSOES_DB)
+        if diretorio:
+            os.makedirs(diretorio, exist_ok=True)
+        conn = sqlite3.connect(VERSOES_DB, timeout=30, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS coletas (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                escopo TEXT NOT NULL,
+                ts REAL NOT NULL,
+                parcial INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS versoes (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                escopo TEXT NOT NULL,
+                nome TEXT NOT NULL,
+                coleta_id INTEGER NOT NULL,
+                hash TEXT,
+                registro TEXT,
+                removido INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS idx_versoes_escopo ON versoes (escopo, coleta_id, nome);
+        """)
+        _local.conn = conn
+    return conn
+
+
+def _hash(registro):
+    return hashlib.blake2b(json.dumps(registro, sort_keys=True, ensure_ascii=False).encode(), digest_size=16).hexdigest()
+
+
+# ---------------------------
+# Estado de um escopo (módulo + página) após uma coleta
+# ---------------------------
+def estado(escopo, ate_coleta=None):
+    consulta = """
+        SELECT v.nome, v.hash, v.registro FROM versoes v
+        JOIN (SELECT nome, MAX(id) AS id FROM versoes WHERE escopo = ? AND coleta_id <= ? GROUP BY nome) u
+        ON v.id = u.id
+        WHERE v.removido = 0
+    """
+    ate = ate_coleta if ate_coleta is not None else 2 ** 62
+    linhas = _conexao().execute(consulta, (escopo, ate)).fetchall()
+    return {nome: (h, json.loads(registro)) for nome, h, registro in linhas}
+
+
+# ---------------------------
+# Em coletas parciais, transportadoras sem detalhes não foram realmente resolvidas
+# ---------------------------
+def incompleto(registro, parcial):
+    return parcial and not registro.get("detalhes")
+
+
+# ---------------------------
+# Grava a coleta: uma versão nova só quando o registro muda
+# ---------------------------
+def registrar(escopo, transportadoras, parcial=False):
+    conn = _conexao()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        anterior = estado(escopo)
+        coleta_id = conn.execute(
+            "INSERT INTO coletas (escopo, ts, parcial) VALUES (?, ?, ?)", (escopo, time.time(), int(parcial))
+        ).lastrowid
+        atuais = set()
+        for registro in transportadoras:
+            if incompleto(registro, parcial):
+                continue
+            nome = registro["nome"]
+            atuais.add(nome)
+            h = _hash(registro)
+            if nome not in anterior or anterior[nome][0] != h:
+                conn.execute(
+                    "INSERT INTO versoes (escopo, nome, coleta_id, hash, registro) VALUES (?, ?, ?, ?, ?)",
+                    (escopo, nome, coleta_id, h, json.dumps(registro, ensure_ascii=False))
+                )
+        # Resultado parcial não prova que uma transportadora sumiu
+        if not parcial:
+            for nome in anterior.keys() - atuais:
+                conn.execute(
+                    "INSERT INTO versoes (escopo, nome, coleta_id, removido) VALUES (?, ?, ?, 1)",
+                    (escopo, nome, coleta_id)
+                )
+        conn.execute("COMMIT")
+    except Exception:
+        conn.execute("ROLLBACK")
+        raise
+    return coleta_id
+
+
+# ---------------------------
+# since = id de coleta, epoch (s) ou data ISO → id de coleta
+# ---------------------------
+def resolver_since(since):
+    try:
+        valor = float(since)
+    except ValueError:
+        valor = datetime.fromisoformat(since).timestamp()
+    else:
+        if not math.isfinite(valor):
+            raise ValueError(f"since não finito: {since}")
+        if valor < 1e9:
+            return int(valor)
+    linha = _conexao().execute("SELECT MAX(id) FROM coletas WHERE ts <= ?", (valor,)).fetchone()
+    return linha[0] or 0
+
+
+# ---------------------------
+# Diferença campo a campo entre dois registros
+# ---------------------------
+def diff(antes, depois, prefixo=""):
+    mudancas = {}
+    for chave in list(dict.fromkeys(list(antes) + list(depois))):
+        caminho = f"{prefixo}{chave}"
+        a, d = antes.get(chave), depois.get(chave)
+        if a == d:
+            continue
+        if isinstance(a, dict) and isinstance(d, dict):
+            mudancas.update(diff(a, d, caminho + "."))
+        elif isinstance(a, list) and isinstance(d, list):
+            mudancas[caminho] = {
+                "adicionados": [x for x in d if x not in a],
+                "removidos": [x for x in a if x not in d]
+            }
+        else:
+            mudancas[caminho] = {"de": a, "para": d}
+    return mudancas
+
+
+# ---------------------------
+# Delta do resultado atual em relação ao estado após a coleta `since`
+# ---------------------------
+def delta(escopo, transportadoras, since, parcial=False):
+    antes = estado(escopo, resolver_since(since))
+    depois = {registro["nome"]: registro for registro in transportadoras if not incompleto(registro, parcial)}
+
+    adicionadas = [registro for nome, registro in depois.items() if nome not in antes]
+    alteradas = [
+        {"nome": nome, "diff": diff(antes[nome][1], registro)}
+        for nome, registro in depois.items()
+        if nome in antes and antes[nome][0] != _hash(registro)
+    ]
+    removidas = [] if parcial else sorted(antes.keys() - depois.keys())
+    return {"adicionadas": adicionadas, "alteradas": alteradas, "removidas": removidas}
+
+
+# ---------------------------
+# Estado atual de todos os escopos, em lotes (exportação)
+# ---------------------------
+def iterar_estado(prefixo=None, lote=1000):
+    consulta = """
+        SELECT v.escopo, v.nome, v.coleta_id, v.registro FROM versoes v
+        JOIN (SELECT MAX(id) AS id FROM versoes WHERE escopo LIKE ? GROUP BY escopo, nome) u
+        ON v.id = u.id
+        WHERE v.removido = 0
+        ORDER BY v.escopo, v.nome
+    """
+    cursor = _conexao().execute(consulta, (f"{prefixo}:%" if prefixo else "%",))
+    while True:
+        linhas = cursor.fetchmany(lote)
+        if not linhas:
+            return
+        for escopo, nome, coleta_id, registro in linhas:
+            yield escopo, nome, coleta_id, json.loads(registro)